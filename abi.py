@@ -1,21 +1,55 @@
+import os
+import shutil
 import threading
 
-from constants import STATIC_BUILD
+from constants import COMPILER_CACHE, DEBUG_INFO, PREFIX_MAPS, REPRODUCIBLE, STATIC_BUILD, TIME_TRACE, toolchain_path
 
 
 class ABI:
-    def __init__(self, arch: str, cross_prefix: str, cc: str, cxx: str, extra_flags: list[str] | None = None):
+    def __init__(self, arch: str, cross_prefix: str, cc: str, cxx: str, extra_flags: list[str] | None = None, host: bool = False):
         self.arch = arch
         self.cross_prefix = cross_prefix
         self.cc = cc
         self.cxx = cxx
         self.extra_flags = extra_flags
 
-        self.c_flags = ["-O3", "-fPIC"]
+        # built with the host's compiler for the machine running the script, for benchmarking without a device
+        self.host = host
+
+        # put in front of every compile, not when time tracing because a cache hit writes no trace
+        self.launcher: list[str] = ["ccache"] if COMPILER_CACHE and not TIME_TRACE and shutil.which("ccache") is not None else []
+
+        # given to every build system on top of the recipe's own flags, cmake and meson only get these and not all of c_flags/ld_flags
+        self.common_c_flags: list[str] = []
+        self.common_ld_flags: list[str] = []
+
+        # debug info in .dwo files next to the objects, packed per shared library with llvm-dwp after install
+        self.split_dwarf: bool = False
+
+        if TIME_TRACE:
+            self.common_c_flags += ["-ftime-trace"]
+
+        # -ffile-prefix-map covers __FILE__ and debug info, -fdebug-prefix-map is there for compilers that predate it
+        if REPRODUCIBLE:
+            for path, replacement in PREFIX_MAPS:
+                self.common_c_flags += [f"-ffile-prefix-map={path}={replacement}", f"-fdebug-prefix-map={path}={replacement}"]
+
+        if DEBUG_INFO:
+            self.common_c_flags += ["-g", "-gz=zlib"]
+            self.common_ld_flags += ["-gz=zlib"]
+
+            # static archives are linked by whoever uses them, they would need every .dwo file too, so only shared builds split
+            self.split_dwarf = not STATIC_BUILD and shutil.which(self.tool("llvm-dwp")) is not None
+
+            if self.split_dwarf:
+                self.common_c_flags += ["-gsplit-dwarf"]
+
+        self.c_flags = ["-O3", "-fPIC"] + self.common_c_flags
         self.c_flags_lock = threading.Lock()
-        self.ld_flags = ["-Wl,-z,max-page-size=16384", "-lm"]
+        self.ld_flags = ["-Wl,-z,max-page-size=16384", "-lm"] + self.common_ld_flags
 
-        if STATIC_BUILD:
+        # the libraries are still static on the host, but fully static programs don't work well with glibc (dlopen, getaddrinfo)
+        if STATIC_BUILD and not host:
             self.ld_flags += ["-static"]
 
         self.ld_flags_lock = threading.Lock()
@@ -25,20 +59,36 @@ class ABI:
     def command(self) -> list[str]:
         result: list[str] = [
             f"--arch={self.arch}",
-            f"--cross-prefix={self.cross_prefix}",
-            f"--cc={self.cc}",
-            f"--cxx={self.cxx}",
+            f"--cc={self.launched(self.cc)}",
+            f"--cxx={self.launched(self.cxx)}",
             f"--extra-cflags={" ".join(self.c_flags)}",
             f"--extra-ldflags={" ".join(self.ld_flags)}"
         ]
 
+        if self.cross_prefix:
+            result.append(f"--cross-prefix={self.cross_prefix}")
+
         if self.extra_flags is not None:
             result.extend(self.extra_flags)
 
         return result
 
-    # armeabi-v7a, arm64-v8a, x86, x86_64
+    # "ccache clang" for build systems that take the compiler as one command line
+    def launched(self, compiler: str) -> str:
+        return " ".join(self.launcher + [compiler])
+
+    # llvm-ar, llvm-strip... from the ndk, or the host's ar, strip...
+    def tool(self, name: str) -> str:
+        if self.host:
+            return name.removeprefix("llvm-")
+
+        return os.path.join(toolchain_path, "bin", name)
+
+    # armeabi-v7a, arm64-v8a, x86, x86_64, or linux-x86_64 for the host
     def android_arch_abi_name(self) -> str:
+        if self.host:
+            return f"linux-{self.arch}"
+
         match self.arch:
             case "arm":
                 return "armeabi-v7a"
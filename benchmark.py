@@ -0,0 +1,308 @@
+import datetime
+import glob
+import hashlib
+import json
+import re
+import resource
+import statistics
+import subprocess
+import time
+
+from constants import *
+from dependencies import toolchain_fingerprint
+
+BENCHMARK_ROOT: str = os.path.join(CWD, "benchmark")
+
+# made once with the first build that can encode them, so every later build decodes exactly the same input
+CLIPS_ROOT: str = os.path.join(CACHE_ROOT, "benchmark")
+
+# ffmpeg's lavfi test sources, the same on every machine
+VIDEO_SOURCE: str = "testsrc2=size=1280x720:rate=30:duration=10"
+AUDIO_SOURCE: str = "sine=frequency=440:sample_rate=48000:duration=60"
+
+# checkasm function timings that moved by more than this are listed
+CHECKASM_THRESHOLD: float = 0.05
+
+CODEC_LINE = re.compile(r"^\s*[VAS][A-Z.]{5}\s+(\S+)")
+CHECKASM_LINE = re.compile(r"^(\w+):\s+(-?\d+(?:\.\d+)?)")
+
+
+class Clip:
+    def __init__(self, name: str, encoder: str, input_args: list[str], output_args: list[str]):
+        self.name = name
+        self.encoder = encoder
+        self.input_args = input_args
+        self.output_args = output_args
+
+
+class Case:
+    def __init__(self, name: str, codec: str, args: list[str]):
+        self.name = name
+        # the encoder or decoder the build needs for this case, it's skipped otherwise
+        self.codec = codec
+        self.args = args
+
+
+CLIPS: list[Clip] = [
+    Clip("av1.mkv", "libaom-av1", ["-f", "lavfi", "-i", VIDEO_SOURCE], ["-c:v", "libaom-av1", "-cpu-used", "8", "-crf", "30"]),
+    Clip("hevc.mkv", "libkvazaar", ["-f", "lavfi", "-i", VIDEO_SOURCE], ["-c:v", "libkvazaar", "-kvazaar-params", "preset=ultrafast"]),
+    Clip("mpeg4.mkv", "mpeg4", ["-f", "lavfi", "-i", VIDEO_SOURCE], ["-c:v", "mpeg4", "-q:v", "4"]),
+    Clip("audio.mp3", "libmp3lame", ["-f", "lavfi", "-i", AUDIO_SOURCE], ["-c:a", "libmp3lame", "-b:a", "192k"])
+]
+
+ENCODE_CASES: list[Case] = [
+    Case("encode libaom-av1", "libaom-av1", ["-f", "lavfi", "-i", VIDEO_SOURCE, "-c:v", "libaom-av1", "-cpu-used", "8", "-crf", "30"]),
+    Case("encode libkvazaar", "libkvazaar", ["-f", "lavfi", "-i", VIDEO_SOURCE, "-c:v", "libkvazaar", "-kvazaar-params", "preset=ultrafast"]),
+    Case("encode mpeg4", "mpeg4", ["-f", "lavfi", "-i", VIDEO_SOURCE, "-c:v", "mpeg4", "-q:v", "4"]),
+    Case("encode libmp3lame", "libmp3lame", ["-f", "lavfi", "-i", AUDIO_SOURCE, "-c:a", "libmp3lame", "-b:a", "192k"])
+]
+
+DECODE_CASES: list[Case] = [
+    Case("decode libdav1d", "libdav1d", ["-c:v", "libdav1d", "-i", os.path.join(CLIPS_ROOT, "av1.mkv")]),
+    Case("decode libaom-av1", "libaom-av1", ["-c:v", "libaom-av1", "-i", os.path.join(CLIPS_ROOT, "av1.mkv")]),
+    Case("decode hevc", "hevc", ["-c:v", "hevc", "-i", os.path.join(CLIPS_ROOT, "hevc.mkv")]),
+    Case("decode mpeg4", "mpeg4", ["-c:v", "mpeg4", "-i", os.path.join(CLIPS_ROOT, "mpeg4.mkv")]),
+    Case("decode mp3", "mp3float", ["-c:a", "mp3float", "-i", os.path.join(CLIPS_ROOT, "audio.mp3")])
+]
+
+LIBRARY_VERSIONS: dict[str, str] = {
+    "libaom": LIBAOM_VERSION,
+    "amf": AMF_VERSION,
+    "avisynth": AVISYNTH_VERSION,
+    "chromaprint": CHROMAPRINT_VERSION,
+    "libcodec2": LIBCODEC2_VERSION,
+    "libdav1d": LIBDAV1D_VERSION,
+    "libuavs3d": LIBUAVS3_VERSION,
+    "libdavs2": LIBDAVS2_VERSION,
+    "libgme": LIBGME_VERSION,
+    "libmfx": LIBMFX_VERSION,
+    "libkvazaar": LIBKVAZAAR_VERSION,
+    "libmp3lame": LIBMP3LAME_VERSION
+}
+
+
+def ffmpeg_path(abi: ABI) -> str:
+    return os.path.join(INSTALL_ROOT, abi.android_arch_abi_name(), "ffmpeg", "bin", "ffmpeg")
+
+
+def library_env(abi: ABI) -> dict[str, str]:
+    # shared builds run against the installed libraries, and checkasm against the ones in ffmpeg's build directory
+    lib_directories = glob.glob(os.path.join(INSTALL_ROOT, abi.android_arch_abi_name(), "*", "lib")) + glob.glob(os.path.join(BUILD_ROOT, abi.android_arch_abi_name(), "ffmpeg", "lib*"))
+
+    env = os.environ.copy()
+    env["LD_LIBRARY_PATH"] = ":".join(lib_directories + [env["LD_LIBRARY_PATH"]] if env.get("LD_LIBRARY_PATH") else lib_directories)
+
+    return env
+
+
+def available_codecs(abi: ABI) -> set[str]:
+    codecs: set[str] = set()
+
+    for kind in ["-encoders", "-decoders"]:
+        output = subprocess.run([ffmpeg_path(abi), "-hide_banner", kind], env=library_env(abi), stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True).stdout
+
+        for line in output.splitlines():
+            match = CODEC_LINE.match(line)
+
+            if match is not None:
+                codecs.add(match.group(1))
+
+    return codecs
+
+
+def build_flags(abi: ABI) -> dict:
+    configuration = subprocess.run([ffmpeg_path(abi), "-hide_banner", "-buildconf"], env=library_env(abi), stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True).stdout
+
+    # the install paths in the configure line depend on where the script runs, not on how the build was made
+    return {
+        "configuration": configuration.replace(CWD, "."),
+        "external_lib_build_type": EXTERNAL_LIB_BUILD_TYPE,
+        "static_build": STATIC_BUILD,
+        "versions": {"ffmpeg": FFMPEG_VERSION} | {lib: LIBRARY_VERSIONS[lib] for lib in EXTERNAL_LIBS if lib in LIBRARY_VERSIONS},
+        "toolchain": toolchain_fingerprint(abi)
+    }
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+
+    return ""
+
+
+def make_clips(abi: ABI, codecs: set[str]) -> None:
+    os.makedirs(CLIPS_ROOT, exist_ok=True)
+
+    for clip in CLIPS:
+        path = os.path.join(CLIPS_ROOT, clip.name)
+
+        if os.path.exists(path) or clip.encoder not in codecs:
+            continue
+
+        print(f"Making benchmark clip {clip.name} with {clip.encoder}")
+
+        # the extension tells ffmpeg which muxer to use, so it has to stay at the end of the temporary name
+        temporary_path = os.path.join(CLIPS_ROOT, f"{os.getpid()}.tmp.{clip.name}")
+        subprocess.run([ffmpeg_path(abi), "-nostdin", "-hide_banner", "-loglevel", "error", "-y"] + clip.input_args + clip.output_args + [temporary_path], env=library_env(abi), check=True)
+        os.replace(temporary_path, path)
+
+
+def time_case(abi: ABI, case: Case) -> dict:
+    env = library_env(abi)
+    seconds: list[float] = []
+    cpu_seconds: list[float] = []
+
+    for _ in range(BENCHMARK_RUNS):
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+
+        subprocess.run([ffmpeg_path(abi), "-nostdin", "-hide_banner", "-loglevel", "error"] + case.args + ["-f", "null", "-"], env=env, check=True)
+
+        seconds.append(time.perf_counter() - start)
+
+        end_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_seconds.append(end_usage.ru_utime + end_usage.ru_stime - usage.ru_utime - usage.ru_stime)
+
+    return {
+        "seconds": seconds,
+        "median": statistics.median(seconds),
+        "best": min(seconds),
+        "cpu_median": statistics.median(cpu_seconds)
+    }
+
+
+def checkasm(abi: ABI) -> dict[str, float]:
+    build_directory = os.path.join(BUILD_ROOT, abi.android_arch_abi_name(), "ffmpeg")
+
+    print(f"Making checkasm for {abi.android_arch_abi_name()} at {build_directory}")
+    subprocess.run(["make", f"-j{JOBS}", "tests/checkasm/checkasm"], cwd=build_directory, check=True)
+
+    print(f"Running checkasm --bench for {abi.android_arch_abi_name()}")
+    result = subprocess.run([os.path.join(build_directory, "tests", "checkasm", "checkasm"), "--bench"], cwd=build_directory, env=library_env(abi), stdin=subprocess.DEVNULL, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        print(result.stdout + result.stderr)
+        raise ChildProcessError(f"checkasm failed for {abi.android_arch_abi_name()}")
+
+    # one line per benchmarked function, e.g. "h264_idct4_add_8bpp_avx:    10.1 ( 4.19x)", in decicycles or nanoseconds
+    timings: dict[str, float] = {}
+
+    for line in result.stdout.splitlines():
+        match = CHECKASM_LINE.match(line.strip())
+
+        if match is not None:
+            timings[match.group(1)] = float(match.group(2))
+
+    return timings
+
+
+def previous_record(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+
+    last_line: str = ""
+
+    with open(path) as results_file:
+        for line in results_file:
+            if line.strip():
+                last_line = line
+
+    return json.loads(last_line) if last_line else None
+
+
+def print_record(record: dict, previous: dict | None) -> None:
+    print(f"Benchmark for {record["abi"]}, flags hash {record["flags_hash"]}, {BENCHMARK_RUNS} runs each" + (f", compared with {previous["flags_hash"]} from {previous["time"]}" if previous is not None else ""))
+
+    previous_cases: dict = previous["cases"] if previous is not None else {}
+
+    for name, result in record["cases"].items():
+        change = ""
+
+        if name in previous_cases:
+            change = f"{(result["median"] / previous_cases[name]["median"] - 1) * 100:+.1f}%"
+
+        print(f"    {name:<24}{result["median"]:>9.3f}s  best {result["best"]:>8.3f}s  cpu {result["cpu_median"]:>8.3f}s  {change}")
+
+    if not record["checkasm"]:
+        return
+
+    previous_checkasm: dict = previous["checkasm"] if previous is not None else {}
+    changes: list[tuple[float, str]] = []
+
+    for name, value in record["checkasm"].items():
+        if previous_checkasm.get(name, 0) > 0:
+            ratio = value / previous_checkasm[name] - 1
+
+            if abs(ratio) > CHECKASM_THRESHOLD:
+                changes.append((ratio, name))
+
+    print(f"    checkasm: {len(record["checkasm"])} functions timed, {len(changes)} moved by more than {CHECKASM_THRESHOLD:.0%}")
+
+    for ratio, name in sorted(changes, key=lambda change: -abs(change[0]))[:20]:
+        print(f"        {name:<48}{ratio * 100:+.1f}%")
+
+
+def benchmark_abi(abi: ABI) -> None:
+    abi_name = abi.android_arch_abi_name()
+
+    if not os.path.exists(ffmpeg_path(abi)):
+        raise FileNotFoundError(f"No ffmpeg program for {abi_name} at {ffmpeg_path(abi)}, build it first")
+
+    codecs = available_codecs(abi)
+    make_clips(abi, codecs)
+
+    build = build_flags(abi)
+
+    record: dict = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "abi": abi_name,
+        "flags_hash": hashlib.sha256(json.dumps(build, sort_keys=True).encode()).hexdigest()[:16],
+        "cpu": cpu_model(),
+        "build": build,
+        "cases": {},
+        "checkasm": {}
+    }
+
+    for case in ENCODE_CASES + DECODE_CASES:
+        # decode cases need their clip, which needs an encoder this build may not have
+        if case.codec not in codecs or any(arg.startswith(CLIPS_ROOT) and not os.path.exists(arg) for arg in case.args):
+            print(f"Skipping {case.name}, not available in this build")
+            continue
+
+        print(f"Timing {case.name} for {abi_name}")
+        record["cases"][case.name] = time_case(abi, case)
+
+    record["checkasm"] = checkasm(abi)
+
+    results_path = os.path.join(BENCHMARK_ROOT, f"{abi_name}.jsonl")
+    previous = previous_record(results_path)
+
+    os.makedirs(BENCHMARK_ROOT, exist_ok=True)
+
+    with open(results_path, "a") as results_file:
+        results_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+    print_record(record, previous)
+
+    print(f"Benchmark results appended to {results_path}")
+
+
+def benchmark() -> None:
+    host_abis: list[ABI] = [abi for abi in ABIS if abi.host]
+
+    # android builds can't run here, only the host target is benchmarked
+    if not host_abis:
+        print(f"No host abi enabled, add {", ".join(abi.android_arch_abi_name() for abi in HOST_ABIS)} to --abis to benchmark")
+        return
+
+    for abi in host_abis:
+        benchmark_abi(abi)
+
+
+if __name__ == "__main__":
+    benchmark()
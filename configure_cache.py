@@ -0,0 +1,169 @@
+import fcntl
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from constants import *
+from dependencies import toolchain_fingerprint
+
+# help strings CMake's check_* modules write above their results in CMakeCache.txt, only these probes are reused
+CMAKE_PROBE_HELP_STRINGS: tuple[str, ...] = (
+    "Have include ",
+    "Have includes ",
+    "Have function ",
+    "Have symbol ",
+    "Have library ",
+    "Have struct member "
+)
+
+# probes write INTERNAL entries, the ones seeded from an earlier configure stay STRING
+CMAKE_CACHE_ENTRY = re.compile(r"^([A-Za-z0-9_.+-]+):(?:INTERNAL|STRING)=(.*)$")
+
+configure_cache_lock = threading.Lock()
+
+
+def configure_cache_directory(abi: ABI) -> str:
+    directory = os.path.join(CACHE_ROOT, "configure", f"{abi.android_arch_abi_name()}-{toolchain_fingerprint(abi)}")
+    os.makedirs(directory, exist_ok=True)
+
+    return directory
+
+
+@contextmanager
+def locked(directory: str):
+    # matrix cells with the same toolchain are separate processes sharing the same cache directory
+    with configure_cache_lock, open(os.path.join(directory, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_atomically(path: str, content: str) -> None:
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temporary_path, "w") as file:
+        file.write(content)
+
+    os.replace(temporary_path, path)
+
+
+def cmake_probes_directory(abi: ABI, lib_name: str) -> str:
+    # only one library's probes are reused for it, the same variable in another project can be a different probe (other symbol, header or CMAKE_REQUIRED_* flags)
+    directory = os.path.join(configure_cache_directory(abi), "cmake", lib_name)
+    os.makedirs(directory, exist_ok=True)
+
+    return directory
+
+
+def cmake_quoted(value: str) -> str:
+    return "\"" + value.replace("\\", "\\\\").replace("\"", "\\\"").replace("$", "\\$") + "\""
+
+
+def cmake_initial_cache(abi: ABI, lib_name: str) -> str | None:
+    if not CONFIGURE_CACHE:
+        return None
+
+    path = os.path.join(cmake_probes_directory(abi, lib_name), "initial_cache.cmake")
+
+    return path if os.path.exists(path) else None
+
+
+def record_cmake_probes(abi: ABI, lib_name: str, build_directory: str) -> None:
+    if not CONFIGURE_CACHE:
+        return
+
+    cmake_cache_path = os.path.join(build_directory, "CMakeCache.txt")
+
+    if not os.path.exists(cmake_cache_path):
+        return
+
+    # name -> [help string, value]
+    probes: dict[str, list[str]] = {}
+    help_string: str = ""
+
+    with open(cmake_cache_path) as cmake_cache:
+        for line in cmake_cache:
+            line = line.rstrip("\n")
+
+            if line.startswith("//"):
+                help_string = line[2:]
+                continue
+
+            match = CMAKE_CACHE_ENTRY.match(line)
+
+            if match is not None and help_string.startswith(CMAKE_PROBE_HELP_STRINGS):
+                probes[match.group(1)] = [help_string, match.group(2)]
+
+            help_string = ""
+
+    directory = cmake_probes_directory(abi, lib_name)
+    probes_path = os.path.join(directory, "cmake_probes.json")
+
+    with locked(directory):
+        known: dict[str, list[str] | None] = {}
+
+        if os.path.exists(probes_path):
+            with open(probes_path) as probes_file:
+                known = json.load(probes_file)
+
+        for name, probe in probes.items():
+            # another configure of this library got a different answer or asked something else under the same name, stop reusing it
+            if name in known and known[name] != probe:
+                known[name] = None
+            else:
+                known[name] = probe
+
+        write_atomically(probes_path, json.dumps(known, indent=2, sort_keys=True))
+
+        # not forced, a result already in the build directory's cache is kept, and the check_* macros skip names that are defined
+        lines = [f"set({name} {cmake_quoted(probe[1])} CACHE STRING {cmake_quoted(probe[0])})" for name, probe in sorted(known.items()) if probe is not None]
+        write_atomically(os.path.join(directory, "initial_cache.cmake"), "\n".join(lines) + "\n")
+
+
+def autoconf_cache_path(abi: ABI, env: dict[str, str]) -> str:
+    # autoconf refuses a cache made with different compilers or flags, so those are part of the key
+    hasher = hashlib.sha256()
+
+    for name in ["CC", "CXX", "CFLAGS", "CXXFLAGS", "CPPFLAGS", "LDFLAGS", "LIBS"]:
+        hasher.update(f"{name}={env.get(name, "")}\n".encode())
+
+    return os.path.join(configure_cache_directory(abi), f"config-{hasher.hexdigest()[:16]}.cache")
+
+
+def run_autoconf_configure(abi: ABI, configure_commands: list[str], env: dict[str, str], build_directory: str) -> None:
+    if not CONFIGURE_CACHE:
+        subprocess.run(configure_commands, env=env, check=True)
+        return
+
+    shared_cache_path = autoconf_cache_path(abi, env)
+    local_cache_path = os.path.join(build_directory, "config.cache")
+
+    # configure rewrites its cache file as it goes, work on a copy so other builds never see a half written one
+    if os.path.exists(shared_cache_path):
+        shutil.copyfile(shared_cache_path, local_cache_path)
+    elif os.path.exists(local_cache_path):
+        os.remove(local_cache_path)
+
+    try:
+        subprocess.run(configure_commands + [f"--cache-file={local_cache_path}"], env=env, check=True)
+    except subprocess.CalledProcessError:
+        if not os.path.exists(shared_cache_path):
+            raise
+
+        print(f"Configure failed with the cached results from {shared_cache_path}, trying again without them")
+        os.remove(local_cache_path)
+        subprocess.run(configure_commands + [f"--cache-file={local_cache_path}"], env=env, check=True)
+
+    directory = configure_cache_directory(abi)
+
+    with locked(directory):
+        temporary_path = f"{shared_cache_path}.{os.getpid()}.tmp"
+        shutil.copyfile(local_cache_path, temporary_path)
+        os.replace(temporary_path, shared_cache_path)
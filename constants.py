@@ -1,10 +1,9 @@
 import os
+import sys
 from argparse import Namespace
 import argparse
 from pathlib import Path
 
-from abi import ABI
-
 
 def get_args() -> Namespace:
     parser = argparse.ArgumentParser(description="Python script to help in building ffmpeg and related external libraries for android")
@@ -34,6 +33,52 @@ def get_args() -> Namespace:
 
     parser.add_argument("--jobs", type=str, default=None)
 
+    parser.add_argument("--watch", type=str, default=None)
+
+    # comma separated values, one build per combination, e.g. --matrix_static_build=true,false --matrix_android_api=24,28
+    parser.add_argument("--matrix_static_build", type=str, default=None)
+    parser.add_argument("--matrix_android_api", type=str, default=None)
+    parser.add_argument("--matrix_external_lib_build_type", type=str, default=None)
+
+    parser.add_argument("--build_namespace", type=str, default=None)
+    parser.add_argument("--fetch_only", type=str, default=None)
+    parser.add_argument("--sources_prepared", type=str, default=None)
+
+    parser.add_argument("--configure_cache", type=str, default=None)
+    parser.add_argument("--dedup_installs", type=str, default=None)
+    parser.add_argument("--compiler_cache", type=str, default=None)
+
+    # comma separated, only build these libraries/abis, and optionally not ffmpeg
+    parser.add_argument("--external_libs", type=str, default=None)
+    parser.add_argument("--abis", type=str, default=None)
+    parser.add_argument("--skip_ffmpeg", type=str, default=None)
+
+    # distributed builds, --workers=host:port,host:port on the coordinator, --worker_listen=host:port on each worker
+    parser.add_argument("--workers", type=str, default=None)
+    parser.add_argument("--worker_listen", type=str, default=None)
+    parser.add_argument("--worker_directory", type=str, default=None)
+    parser.add_argument("--local_workers", type=str, default=None)
+
+    # shared secret the coordinator sends and every worker checks, better given through the WORKER_TOKEN environment variable so it isn't in the process list
+    parser.add_argument("--worker_token", type=str, default=None)
+
+    parser.add_argument("--verify", type=str, default=None)
+    parser.add_argument("--size_report", type=str, default=None)
+
+    # compilers for the linux-x86_64 host target, --abis=linux-x86_64 to build it
+    parser.add_argument("--host_cc", type=str, default=None)
+    parser.add_argument("--host_cxx", type=str, default=None)
+    parser.add_argument("--benchmark", type=str, default=None)
+    parser.add_argument("--benchmark_runs", type=str, default=None)
+
+    parser.add_argument("--time_trace", type=str, default=None)
+
+    parser.add_argument("--reproducible", type=str, default=None)
+    parser.add_argument("--reproducible_check", type=str, default=None)
+    parser.add_argument("--source_date_epoch", type=str, default=None)
+
+    parser.add_argument("--debug_info", type=str, default=None)
+
     return parser.parse_args()
 
 
@@ -46,6 +91,14 @@ def get_option(arg: str | None, env_var_name: str, default: str) -> str:
         return default
 
 
+def parse_bool(value: str) -> bool:
+    return value.strip().lower() in {"true", "1", "on", "yes", "y"}
+
+
+def get_bool_option(arg: str | None, env_var_name: str, default: bool) -> bool:
+    return parse_bool(get_option(arg, env_var_name, "true" if default else "false"))
+
+
 args = get_args()
 
 # -------------------- CONFIG -------------------
@@ -55,7 +108,7 @@ NDK_PATH: str = get_option(args.android_ndk_path, "ANDROID_NDK_PATH", os.path.jo
 API: str = get_option(args.android_api, "ANDROID_API", "28")
 HOST: str = get_option(args.android_ndk_host, "ANDROID_NDK_HOST", "darwin-x86_64")
 
-STATIC_BUILD: bool = get_option(args.static_build, "STATIC_BUILD", "true").lower() in {"true", "1", "on", "yes", "y"}
+STATIC_BUILD: bool = get_bool_option(args.static_build, "STATIC_BUILD", True)
 
 EXTERNAL_LIB_BUILD_TYPE: str = get_option(args.external_lib_build_type, "EXTERNAL_LIB_BUILD_TYPE", "Release")
 
@@ -75,9 +128,75 @@ LIBKVAZAAR_VERSION: str = get_option(args.libkvazaar_version, "LIBKVAZAAR_VERSIO
 LIBMP3LAME_VERSION: str = get_option(args.libmp3lame_version, "LIBMP3LAME_VERSION", "3.99.5")
 
 # options
-AUTO_ACCEPT_LICENCE: bool = get_option(args.auto_accept_licence, "AUTO_ACCEPT_LICENCE", "yes").lower() in ["yes", "on", "1", "y"]
+AUTO_ACCEPT_LICENCE: bool = get_bool_option(args.auto_accept_licence, "AUTO_ACCEPT_LICENCE", True)
 JOBS: str = get_option(args.jobs, "JOBS", "10")
 
+# keep running after the build, rebuilding libraries whose source changes
+WATCH: bool = get_bool_option(args.watch, "WATCH", False)
+
+# build matrix, empty when only building the single configuration above
+MATRIX_STATIC_BUILD: list[bool] = [parse_bool(value) for value in get_option(args.matrix_static_build, "MATRIX_STATIC_BUILD", "").split(",") if value.strip()]
+MATRIX_API: list[str] = [value.strip() for value in get_option(args.matrix_android_api, "MATRIX_ANDROID_API", "").split(",") if value.strip()]
+MATRIX_EXTERNAL_LIB_BUILD_TYPE: list[str] = [value.strip() for value in get_option(args.matrix_external_lib_build_type, "MATRIX_EXTERNAL_LIB_BUILD_TYPE", "").split(",") if value.strip()]
+MATRIX: bool = bool(MATRIX_STATIC_BUILD or MATRIX_API or MATRIX_EXTERNAL_LIB_BUILD_TYPE)
+
+# sub folder of build/ and install/ for this configuration, set for every cell of a matrix build
+BUILD_NAMESPACE: str = get_option(args.build_namespace, "BUILD_NAMESPACE", "")
+
+# only get the source code, used to fetch once before the cells of a matrix build start
+FETCH_ONLY: bool = get_bool_option(args.fetch_only, "FETCH_ONLY", False)
+
+# the sources were fetched and prepared by someone else (the matrix's fetch step) and are shared, don't write into them
+SOURCES_PREPARED: bool = get_bool_option(args.sources_prepared, "SOURCES_PREPARED", False)
+
+# reuse autoconf and cmake feature probe results between runs and libraries with the same toolchain
+CONFIGURE_CACHE: bool = get_bool_option(args.configure_cache, "CONFIGURE_CACHE", True)
+
+# install through a staging directory, hardlinking identical files across abis and runs and leaving unchanged files untouched
+DEDUP_INSTALLS: bool = get_bool_option(args.dedup_installs, "DEDUP_INSTALLS", True)
+
+# compile through ccache when it's installed, with one cache in cache/ccache for every run, abi and matrix cell
+COMPILER_CACHE: bool = get_bool_option(args.compiler_cache, "COMPILER_CACHE", True)
+
+SKIP_FFMPEG: bool = get_bool_option(args.skip_ffmpeg, "SKIP_FFMPEG", False)
+
+# distributed builds, external library builds are sent to the workers and ffmpeg is built here
+WORKERS: list[str] = [value.strip() for value in get_option(args.workers, "WORKERS", "").split(",") if value.strip()]
+WORKER_LISTEN: str = get_option(args.worker_listen, "WORKER_LISTEN", "")
+WORKER_DIRECTORY: str = get_option(args.worker_directory, "WORKER_DIRECTORY", os.getcwd())
+
+# required by workers listening on anything but loopback, anyone who can connect can run code on a worker
+WORKER_TOKEN: str = get_option(args.worker_token, "WORKER_TOKEN", "")
+
+# how many workers local_workers.py starts on this machine to run a distributed build against
+LOCAL_WORKERS: int = int(get_option(args.local_workers, "LOCAL_WORKERS", "2"))
+
+# check the installed libraries' architecture, page alignment, relocations and symbols after the build and fail it on any issue, opt-in until the checks have been validated against real NDK builds
+VERIFY: bool = get_bool_option(args.verify, "VERIFY", False)
+
+# break the installed libraries down by library, object and symbol, and compare with the previous build
+SIZE_REPORT: bool = get_bool_option(args.size_report, "SIZE_REPORT", False)
+
+HOST_CC: str = get_option(args.host_cc, "HOST_CC", "cc")
+HOST_CXX: str = get_option(args.host_cxx, "HOST_CXX", "c++")
+
+# time decoding, encoding and checkasm with the host build after it's done
+BENCHMARK: bool = get_bool_option(args.benchmark, "BENCHMARK", False)
+BENCHMARK_RUNS: int = int(get_option(args.benchmark_runs, "BENCHMARK_RUNS", "3"))
+
+# compile with clang's -ftime-trace and time every make and ninja step, then rank the slowest files, headers and templates (clang only, use --host_cc=clang for the host target)
+TIME_TRACE: bool = get_bool_option(args.time_trace, "TIME_TRACE", False)
+
+# outputs that don't depend on where the checkout and the ndk are or when they were built, so they can be shared between machines
+REPRODUCIBLE: bool = get_bool_option(args.reproducible, "REPRODUCIBLE", False)
+SOURCE_DATE_EPOCH: str = get_option(args.source_date_epoch, "SOURCE_DATE_EPOCH", "0")
+
+# build twice from two different directories and compare the installed files
+REPRODUCIBLE_CHECK: bool = get_bool_option(args.reproducible_check, "REPRODUCIBLE_CHECK", False)
+
+# build with compressed (and for shared builds split) debug info, then move it into install/<abi>.debug and ship stripped files
+DEBUG_INFO: bool = get_bool_option(args.debug_info, "DEBUG_INFO", False)
+
 # external libraries for ffmpeg (libxavs2 is currently completely broken, I tried to fix it like I did libdavs2 and libuavs3d but to no avail)
 EXTERNAL_LIBS: list[str] = [
     "libaom",
@@ -93,14 +212,114 @@ EXTERNAL_LIBS: list[str] = [
     "libmp3lame"
 ]
 
+if get_option(args.external_libs, "EXTERNAL_LIBS", ""):
+    EXTERNAL_LIBS = [lib.strip() for lib in get_option(args.external_libs, "EXTERNAL_LIBS", "").split(",") if lib.strip()]
+
 toolchain_path: str = os.path.join(NDK_PATH, "toolchains", "llvm", "prebuilt", HOST)
 
 CWD: str = os.getcwd()
 
+BUILD_ROOT: str = os.path.join(CWD, "build", BUILD_NAMESPACE) if BUILD_NAMESPACE else os.path.join(CWD, "build")
+INSTALL_ROOT: str = os.path.join(CWD, "install", BUILD_NAMESPACE) if BUILD_NAMESPACE else os.path.join(CWD, "install")
+
+# shared by every matrix cell
+CACHE_ROOT: str = os.path.join(CWD, "cache")
+
+# replaced in the outputs of reproducible builds, later maps win in the compiler so the ndk comes after the checkout it may be in
+PREFIX_MAPS: list[tuple[str, str]] = [(CWD, "."), (NDK_PATH, "/ndk")]
+
+# imported here because abi.py reads STATIC_BUILD from this module
+from abi import ABI
+
 # ABIS to Build for
 ABIS: list[ABI] = [
     ABI("arm", "arm-linux-androideabi-", os.path.join(toolchain_path, "bin", f"armv7a-linux-androideabi{API}-clang"), os.path.join(toolchain_path, "bin", f"armv7a-linux-androideabi{API}-clang++")),
     ABI("aarch64", "aarch64-linux-android-", os.path.join(toolchain_path, "bin", f"aarch64-linux-android{API}-clang"), os.path.join(toolchain_path, "bin", f"aarch64-linux-android{API}-clang++")),
     # ABI("x86", "i686-linux-android-", os.path.join(toolchain_path, "bin", f"i686-linux-android{API}-clang"), os.path.join(toolchain_path, "bin", f"i686-linux-android{API}-clang++"), ["--disable-x86asm"]),
     # ABI("x86_64", "x86_64-linux-android-", os.path.join(toolchain_path, "bin", f"x86_64-linux-android{API}-clang"), os.path.join(toolchain_path, "bin", f"x86_64-linux-android{API}-clang++"), ["--disable-x86asm"])
-]
\ No newline at end of file
+]
+
+# built with the host's compiler and the same recipes, only when asked for with --abis
+HOST_ABIS: list[ABI] = [
+    ABI("x86_64", "", HOST_CC, HOST_CXX, host=True)
+]
+
+if get_option(args.abis, "ABIS", ""):
+    ABIS = [abi for abi in ABIS + HOST_ABIS if abi.android_arch_abi_name() in get_option(args.abis, "ABIS", "").split(",")]
+
+MAIN_SCRIPT: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# modes that start other builds or never return, a child build is one plain build of a single configuration
+CHILD_MODE_OPTIONS: dict[str, str] = {
+    "watch": "false",
+    "matrix_static_build": "",
+    "matrix_android_api": "",
+    "matrix_external_lib_build_type": "",
+    "workers": "",
+    "worker_listen": "",
+    "reproducible_check": "false",
+    "fetch_only": "false",
+    "sources_prepared": "false"
+}
+
+
+def option_value(value: bool | str | int) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+
+    return str(value)
+
+
+def resolved_options() -> dict[str, str]:
+    # every setting the way this process resolved it from its arguments, the environment and the defaults
+    return {name: option_value(value) for name, value in {
+        "android_ndk_version": NDK_VERSION,
+        "android_ndk_path": NDK_PATH,
+        "android_api": API,
+        "android_ndk_host": HOST,
+        "static_build": STATIC_BUILD,
+        "external_lib_build_type": EXTERNAL_LIB_BUILD_TYPE,
+        "ffmpeg_version": FFMPEG_VERSION,
+        "libaom_version": LIBAOM_VERSION,
+        "amf_version": AMF_VERSION,
+        "avisynth_version": AVISYNTH_VERSION,
+        "chromaprint_version": CHROMAPRINT_VERSION,
+        "libcodec2_version": LIBCODEC2_VERSION,
+        "libdav1d_version": LIBDAV1D_VERSION,
+        "libuavs3_version": LIBUAVS3_VERSION,
+        "libdavs2_version": LIBDAVS2_VERSION,
+        "libgme_version": LIBGME_VERSION,
+        "libmfx_version": LIBMFX_VERSION,
+        "libkvazaar_version": LIBKVAZAAR_VERSION,
+        "libmp3lame_version": LIBMP3LAME_VERSION,
+        "auto_accept_licence": AUTO_ACCEPT_LICENCE,
+        "jobs": JOBS,
+        "build_namespace": BUILD_NAMESPACE,
+        "configure_cache": CONFIGURE_CACHE,
+        "dedup_installs": DEDUP_INSTALLS,
+        "compiler_cache": COMPILER_CACHE,
+        "external_libs": ",".join(EXTERNAL_LIBS),
+        "abis": ",".join(abi.android_arch_abi_name() for abi in ABIS),
+        "skip_ffmpeg": SKIP_FFMPEG,
+        "verify": VERIFY,
+        "size_report": SIZE_REPORT,
+        "host_cc": HOST_CC,
+        "host_cxx": HOST_CXX,
+        "benchmark": BENCHMARK,
+        "benchmark_runs": BENCHMARK_RUNS,
+        "time_trace": TIME_TRACE,
+        "reproducible": REPRODUCIBLE,
+        "source_date_epoch": SOURCE_DATE_EPOCH,
+        "debug_info": DEBUG_INFO
+    }.items()}
+
+
+def child_args(**overrides: str) -> list[str]:
+    # every option given explicitly, a child on another machine or with another environment builds exactly what this process would
+    options = resolved_options() | CHILD_MODE_OPTIONS | overrides
+
+    return [f"--{name}={value}" for name, value in options.items()]
+
+
+def child_command(**overrides: str) -> list[str]:
+    return [sys.executable, MAIN_SCRIPT] + child_args(**overrides)
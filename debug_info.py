@@ -0,0 +1,219 @@
+import hashlib
+import json
+import shutil
+import subprocess
+import threading
+
+from constants import *
+from elf import *
+
+INDEX_NAME: str = "index.json"
+
+# libraries are split and merged from several threads, the index is read, updated and written back under this
+bundle_lock = threading.Lock()
+
+
+def debug_bundle_directory(abi: ABI) -> str:
+    # install/arm64-v8a.debug next to install/arm64-v8a, laid out like a debugger's debug-file-directory
+    return os.path.join(INSTALL_ROOT, f"{abi.android_arch_abi_name()}.debug")
+
+
+def abi_of(install_directory: str) -> ABI | None:
+    # install/<abi>/<lib>
+    abi_name = os.path.relpath(os.path.abspath(install_directory), INSTALL_ROOT).split(os.sep)[0]
+
+    return next((abi for abi in ABIS if abi.android_arch_abi_name() == abi_name), None)
+
+
+def has_debug_info(files: list[ElfFile]) -> bool:
+    return any(section.name.startswith((".debug_", ".zdebug_")) for elf in files for section in elf.sections)
+
+
+def same_content(first_path: str, second_path: str) -> bool:
+    if not os.path.exists(second_path) or os.path.getsize(first_path) != os.path.getsize(second_path):
+        return False
+
+    with open(first_path, "rb") as first_file, open(second_path, "rb") as second_file:
+        return hashlib.file_digest(first_file, "sha256").digest() == hashlib.file_digest(second_file, "sha256").digest()
+
+
+def run_into(command: list[str], output_path: str, cwd: str | None = None) -> None:
+    # the command writes the last argument, which is a temporary file that then replaces output_path, so hardlinks to the old file are never written through
+    temporary_path = f"{output_path}.{os.getpid()}.tmp"
+
+    subprocess.run(command + [temporary_path], cwd=cwd, check=True)
+    os.replace(temporary_path, output_path)
+
+
+def split_linked(abi: ABI, path: str, build_id: str, bundle_directory: str) -> str:
+    debug_path = os.path.join(bundle_directory, ".build-id", build_id[:2], f"{build_id[2:]}.debug")
+    objcopy = abi.tool("llvm-objcopy")
+
+    # the same build id is the same linked file, its debug info is already there
+    if not os.path.exists(debug_path):
+        os.makedirs(os.path.dirname(debug_path), exist_ok=True)
+
+        run_into([objcopy, "--only-keep-debug", path], debug_path)
+
+        # lldb picks up <debug file>.dwp, the .dwo paths in the skeleton units are relative to CWD in reproducible builds
+        if abi.split_dwarf:
+            run_into([abi.tool("llvm-dwp"), "-e", path, "-o"], f"{debug_path}.dwp", cwd=CWD)
+
+    mode = os.stat(path).st_mode
+    run_into([objcopy, "--strip-debug", f"--add-gnu-debuglink={debug_path}", path], path)
+    os.chmod(path, mode)
+
+    return os.path.relpath(debug_path, bundle_directory)
+
+
+def split_archive(abi: ABI, path: str, relative_path: str, bundle_directory: str) -> str:
+    # archives have no build id, whoever links them keeps the unstripped copy from the bundle for builds they want to symbolicate
+    debug_path = os.path.join(bundle_directory, "archives", relative_path)
+
+    if not same_content(path, debug_path):
+        os.makedirs(os.path.dirname(debug_path), exist_ok=True)
+
+        temporary_path = f"{debug_path}.{os.getpid()}.tmp"
+        shutil.copy2(path, temporary_path)
+        os.replace(temporary_path, debug_path)
+
+    mode = os.stat(path).st_mode
+    run_into([abi.tool("llvm-objcopy"), "--strip-debug", path], path)
+    os.chmod(path, mode)
+
+    return os.path.relpath(debug_path, bundle_directory)
+
+
+def load_index(index_path: str) -> dict[str, dict[str, str]]:
+    if not os.path.exists(index_path):
+        return {"build_ids": {}, "archives": {}}
+
+    with open(index_path) as index_file:
+        return json.load(index_file)
+
+
+def update_index(bundle_directory: str, build_ids: dict[str, str], archives: dict[str, str]) -> None:
+    index_path = os.path.join(bundle_directory, INDEX_NAME)
+
+    with bundle_lock:
+        index = load_index(index_path)
+        index["build_ids"].update(build_ids)
+        index["archives"].update(archives)
+
+        os.makedirs(bundle_directory, exist_ok=True)
+
+        temporary_path = f"{index_path}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "w") as index_file:
+            json.dump(index, index_file, indent=2, sort_keys=True)
+
+        os.replace(temporary_path, index_path)
+
+
+def split_debug_info(directory: str, install_directory: str) -> None:
+    # directory is either the install directory itself or the staging directory standing in for it
+    abi = abi_of(install_directory)
+
+    if abi is None:
+        return
+
+    bundle_directory = debug_bundle_directory(abi)
+    library_path = os.path.relpath(os.path.abspath(install_directory), os.path.join(INSTALL_ROOT, abi.android_arch_abi_name()))
+
+    build_ids: dict[str, str] = {}
+    archives: dict[str, str] = {}
+
+    moved: int = 0
+
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+
+            data = open_mapped(path)
+
+            if data is None:
+                continue
+
+            try:
+                files = elf_files(path, data)
+                is_archive = data[:8] == AR_MAGIC
+                build_id = files[0].build_id() if files and not is_archive and files[0].type in (ET_EXEC, ET_DYN) else None
+                debug_info = has_debug_info(files)
+            finally:
+                data.close()
+
+            if not debug_info:
+                continue
+
+            relative_path = os.path.join(library_path, os.path.relpath(path, directory))
+
+            if is_archive:
+                archives[relative_path] = split_archive(abi, path, relative_path, bundle_directory)
+            elif build_id is not None:
+                build_ids[build_id] = relative_path
+                split_linked(abi, path, build_id, bundle_directory)
+            else:
+                print(f"{relative_path} has no build id, leaving its debug info in")
+                continue
+
+            moved += 1
+
+    if moved:
+        update_index(bundle_directory, build_ids, archives)
+
+    print(f"Moved debug info of {moved} files for {library_path} to {bundle_directory}")
+
+
+def export_debug_info(bundle_directory: str, library_path: str, directory: str) -> bool:
+    # the bundle entries of one library, with an index of their own, copied to directory so a worker can send them back
+    index = load_index(os.path.join(bundle_directory, INDEX_NAME))
+
+    build_ids = {build_id: path for build_id, path in index["build_ids"].items() if path.startswith(library_path + os.sep)}
+    archives = {path: debug_path for path, debug_path in index["archives"].items() if path.startswith(library_path + os.sep)}
+
+    if not build_ids and not archives:
+        return False
+
+    debug_paths: list[str] = list(archives.values())
+
+    for build_id in build_ids:
+        debug_path = os.path.join(".build-id", build_id[:2], f"{build_id[2:]}.debug")
+        debug_paths.extend(path for path in [debug_path, f"{debug_path}.dwp"] if os.path.exists(os.path.join(bundle_directory, path)))
+
+    for debug_path in debug_paths:
+        os.makedirs(os.path.dirname(os.path.join(directory, debug_path)), exist_ok=True)
+        shutil.copy2(os.path.join(bundle_directory, debug_path), os.path.join(directory, debug_path))
+
+    with open(os.path.join(directory, INDEX_NAME), "w") as index_file:
+        json.dump({"build_ids": build_ids, "archives": archives}, index_file, indent=2, sort_keys=True)
+
+    return True
+
+
+def merge_debug_info(directory: str, bundle_directory: str) -> None:
+    # what export_debug_info wrote, into this machine's bundle
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, directory)
+
+            if relative_path == INDEX_NAME:
+                continue
+
+            debug_path = os.path.join(bundle_directory, relative_path)
+
+            # a build id names exactly one linked file, archives are replaced when they changed
+            if (relative_path.startswith(".build-id" + os.sep) and os.path.exists(debug_path)) or same_content(path, debug_path):
+                continue
+
+            os.makedirs(os.path.dirname(debug_path), exist_ok=True)
+
+            temporary_path = f"{debug_path}.{os.getpid()}.tmp"
+            shutil.copy2(path, temporary_path)
+            os.replace(temporary_path, debug_path)
+
+    index = load_index(os.path.join(directory, INDEX_NAME))
+    update_index(bundle_directory, index["build_ids"], index["archives"])
@@ -0,0 +1,190 @@
+import fcntl
+import hashlib
+import shutil
+import stat
+import subprocess
+from contextlib import contextmanager
+
+from constants import *
+from debug_info import split_debug_info
+from reproducible import copy_file, normalize_tree
+
+OBJECTS_ROOT: str = os.path.join(CACHE_ROOT, "objects")
+
+
+@contextmanager
+def store_lock(exclusive: bool):
+    # installs hold it shared while an object can still be waiting to be linked, pruning holds it alone so it never removes one of those
+    os.makedirs(OBJECTS_ROOT, exist_ok=True)
+
+    with open(os.path.join(OBJECTS_ROOT, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def link_file(source: str, destination: str) -> None:
+    try:
+        os.link(source, destination)
+    except OSError:
+        # different file systems, or hardlinks aren't supported
+        copy_file(source, destination)
+
+
+def store_object(path: str) -> str:
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+
+    # the mode is part of the key because every hardlink of an object shares it
+    object_path = os.path.join(OBJECTS_ROOT, f"{file_hash(path)}-{mode:o}")
+    os.makedirs(OBJECTS_ROOT, exist_ok=True)
+
+    # copied, a hardlink would make the object share an inode with whatever is being installed, e.g. a file in the checkout that can still be edited in place
+    if not os.path.exists(object_path):
+        temporary_path = f"{object_path}.{os.getpid()}.tmp"
+        copy_file(path, temporary_path)
+        os.replace(temporary_path, object_path)
+
+    return object_path
+
+
+def sync_file(source: str, destination: str) -> bool:
+    if os.path.islink(source):
+        target = os.readlink(source)
+
+        if os.path.islink(destination) and os.readlink(destination) == target:
+            return False
+
+        temporary_path = f"{destination}.{os.getpid()}.tmp"
+        os.symlink(target, temporary_path)
+        os.replace(temporary_path, destination)
+
+        return True
+
+    object_path = store_object(source)
+    object_stat = os.stat(object_path)
+    newer: bool = True
+
+    if os.path.isfile(destination) and not os.path.islink(destination):
+        destination_stat = os.stat(destination)
+
+        # same inode, or the same content from before it was deduplicated, either way leave it and its mtime alone
+        if (destination_stat.st_dev, destination_stat.st_ino) == (object_stat.st_dev, object_stat.st_ino):
+            return False
+
+        if destination_stat.st_size == object_stat.st_size and stat.S_IMODE(destination_stat.st_mode) == stat.S_IMODE(object_stat.st_mode) and file_hash(destination) == file_hash(object_path):
+            return False
+
+        newer = object_stat.st_mtime_ns > destination_stat.st_mtime_ns
+
+    temporary_path = f"{destination}.{os.getpid()}.tmp"
+
+    if newer:
+        link_file(object_path, temporary_path)
+    else:
+        # the object is older than what was installed before (e.g. content going back to an earlier version), make/ninja
+        # only see the change with a newer mtime, which can't be set on an inode every other install of this content shares
+        copy_file(object_path, temporary_path)
+        os.utime(temporary_path)
+
+    os.replace(temporary_path, destination)
+
+    return True
+
+
+def sync_tree(source_root: str, destination_root: str) -> None:
+    changed: int = 0
+    unchanged: int = 0
+
+    with store_lock(exclusive=False):
+        for directory, sub_directories, names in os.walk(source_root):
+            relative_directory = os.path.relpath(directory, source_root)
+            destination_directory = os.path.normpath(os.path.join(destination_root, relative_directory))
+
+            os.makedirs(destination_directory, exist_ok=True)
+
+            # symlinks to directories are listed as directories by os.walk
+            for name in names + [sub_directory for sub_directory in sub_directories if os.path.islink(os.path.join(directory, sub_directory))]:
+                if sync_file(os.path.join(directory, name), os.path.join(destination_directory, name)):
+                    changed += 1
+                else:
+                    unchanged += 1
+
+    print(f"Synced {source_root} to {destination_root}, {changed} files changed, {unchanged} left untouched")
+
+
+def staged_install(command: list[str], build_directory: str, install_directory: str, env: dict[str, str] | None = None) -> None:
+    if not DEDUP_INSTALLS:
+        subprocess.run(command, cwd=build_directory, env=env, check=True)
+
+        if DEBUG_INFO:
+            split_debug_info(install_directory, install_directory)
+
+        if REPRODUCIBLE:
+            normalize_tree(install_directory, install_directory)
+
+        return
+
+    # install into a staging directory, then only replace the files whose content changed
+    stage_directory = os.path.join(build_directory, "install-stage")
+
+    if os.path.exists(stage_directory):
+        shutil.rmtree(stage_directory)
+
+    stage_env = (env if env is not None else os.environ).copy()
+    stage_env["DESTDIR"] = stage_directory
+
+    subprocess.run(command, cwd=build_directory, env=stage_env, check=True)
+
+    staged_install_directory = os.path.join(stage_directory, os.path.abspath(install_directory).lstrip(os.sep))
+
+    # debug info goes to the bundle first, stripping replaces the staged files so what gets synced is already stripped
+    if DEBUG_INFO:
+        split_debug_info(staged_install_directory, install_directory)
+
+    # archive member order and timestamps, and pkg-config prefixes, are fixed up before anything reaches the install directory
+    if REPRODUCIBLE:
+        normalize_tree(staged_install_directory, install_directory)
+
+    sync_tree(staged_install_directory, install_directory)
+
+    shutil.rmtree(stage_directory)
+
+
+def install_tree(source_root: str, destination_root: str) -> None:
+    if DEDUP_INSTALLS:
+        sync_tree(source_root, destination_root)
+    else:
+        shutil.copytree(src=source_root, dst=destination_root, dirs_exist_ok=True)
+
+
+def prune_objects() -> None:
+    # an object only the store links to isn't installed anywhere anymore, whatever replaced it is another object
+    removed: int = 0
+    freed: int = 0
+
+    if not os.path.isdir(OBJECTS_ROOT):
+        return
+
+    with store_lock(exclusive=True):
+        for name in os.listdir(OBJECTS_ROOT):
+            path = os.path.join(OBJECTS_ROOT, name)
+
+            if name == ".lock" or name.endswith(".tmp"):
+                continue
+
+            object_stat = os.lstat(path)
+
+            if stat.S_ISREG(object_stat.st_mode) and object_stat.st_nlink == 1:
+                os.remove(path)
+                removed += 1
+                freed += object_stat.st_size
+
+    print(f"Pruned {removed} unused objects ({freed:,} bytes) from {OBJECTS_ROOT}")
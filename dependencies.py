@@ -1,24 +1,159 @@
-import os
+import hashlib
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
+from constants import *
+
+# host tools each library needs on top of the ones every build needs
+HOST_TOOLS: list[str] = ["pkg-config", "git", "make"]
+
+LIBRARY_HOST_TOOLS: dict[str, list[str]] = {
+    "libaom": ["cmake"],
+    "avisynth": ["cmake"],
+    "chromaprint": ["cmake"],
+    "libcodec2": ["cmake"],
+    "libdav1d": ["meson", "ninja"],
+    "libuavs3d": ["cmake", "gawk"],
+    "libgme": ["cmake"],
+    "libmfx": ["cmake"],
+    "libkvazaar": ["cmake"],
+    "libmp3lame": ["curl", "tar"]
+}
+
+NDK_TOOLS: list[str] = ["clang", "llvm-ar", "llvm-as", "llvm-nm", "llvm-ranlib", "llvm-strip"]
+
+# what ABI.tool() gives the host target instead of the ndk's tools, and nasm for ffmpeg's x86 assembly
+HOST_TARGET_TOOLS: list[str] = ["ar", "as", "nm", "ranlib", "strip", "nasm"]
+
+TOOLCHAIN_CACHE_PATH: str = os.path.join(CACHE_ROOT, "toolchain.json")
+
+# name -> {"path", "signature", "version", "sha256"}, filled in by probe_toolchain()
+toolchain: dict[str, dict] = {}
+
+
+def required_tools() -> dict[str, str | None]:
+    tools: dict[str, str | None] = {}
+
+    for tool in HOST_TOOLS + [tool for lib in EXTERNAL_LIBS for tool in LIBRARY_HOST_TOOLS.get(lib, [])]:
+        tools[tool] = shutil.which(tool)
+
+    for abi in ABIS:
+        # the host compilers are usually given by name and looked up in PATH
+        tools[f"cc-{abi.android_arch_abi_name()}"] = abi.cc if os.path.isabs(abi.cc) else shutil.which(abi.cc)
+        tools[f"cxx-{abi.android_arch_abi_name()}"] = abi.cxx if os.path.isabs(abi.cxx) else shutil.which(abi.cxx)
+
+    if any(abi.host for abi in ABIS):
+        for tool in HOST_TARGET_TOOLS:
+            tools[tool] = shutil.which(tool)
+
+    # debug_info.py extracts and strips debug info with each abi's objcopy
+    if DEBUG_INFO:
+        for abi in ABIS:
+            tool = abi.tool("llvm-objcopy")
+            tools[os.path.basename(tool)] = tool if os.path.isabs(tool) else shutil.which(tool)
+
+    if any(not abi.host for abi in ABIS):
+        for tool in NDK_TOOLS:
+            tools[tool] = os.path.join(toolchain_path, "bin", tool)
+
+        # identifies the ndk and its sysroot, much cheaper than hashing the whole sysroot
+        tools["ndk"] = os.path.join(NDK_PATH, "source.properties")
+        tools["sysroot"] = os.path.join(toolchain_path, "sysroot", "usr", "include", "android", "api-level.h")
+
+    return tools
+
+
+def signature(path: str) -> list[int]:
+    stat = os.stat(path)
+
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def probe_tool(name: str, path: str, cached: dict | None) -> dict:
+    real_path = os.path.realpath(path)
+    current_signature = signature(real_path)
+
+    # the file hasn't changed since it was last probed, don't run or hash it again
+    if cached is not None and cached["path"] == real_path and cached["signature"] == current_signature:
+        return cached
+
+    hasher = hashlib.sha256()
+
+    with open(real_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+
+    version: str = ""
+
+    if name in ["ndk", "sysroot"]:
+        pass
+    elif os.access(real_path, os.X_OK):
+        result = subprocess.run([path, "--version"], stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        version = (result.stdout or result.stderr).strip().split("\n")[0]
+
+    return {
+        "path": real_path,
+        "signature": current_signature,
+        "version": version,
+        "sha256": hasher.hexdigest()
+    }
+
+
+def probe_toolchain() -> None:
+    tools = required_tools()
+
+    missing: list[str] = [f"{name} ({path})" if path is not None else name for name, path in tools.items() if path is None or not os.path.exists(path)]
+
+    if missing:
+        print("Missing required tools:")
+
+        for tool in missing:
+            print(f"    {tool}")
 
-def check_pkg_config() -> None:
-    if os.system("pkg-config --version") != 0:
-        print("pkg-config is not installed")
         exit(3)
 
+    cached: dict[str, dict] = {}
+
+    if os.path.exists(TOOLCHAIN_CACHE_PATH):
+        with open(TOOLCHAIN_CACHE_PATH) as cache_file:
+            cached = json.load(cache_file)
+
+    with ThreadPoolExecutor(max_workers=len(tools)) as executor:
+        futures = {name: executor.submit(probe_tool, name, path, cached.get(name)) for name, path in tools.items()}
+        probed: dict[str, dict] = {name: future.result() for name, future in futures.items()}
+
+    toolchain.clear()
+    toolchain.update(probed)
+
+    if probed != {name: cached.get(name) for name in probed}:
+        os.makedirs(CACHE_ROOT, exist_ok=True)
+
+        # keep entries of tools this run didn't need, another configuration may still use them
+        temporary_path = f"{TOOLCHAIN_CACHE_PATH}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "w") as cache_file:
+            json.dump(cached | probed, cache_file, indent=2, sort_keys=True)
+
+        os.replace(temporary_path, TOOLCHAIN_CACHE_PATH)
+
+    for name, tool in sorted(probed.items()):
+        if tool["version"]:
+            print(f"Found {name}: {tool["version"]}")
+
+
+def toolchain_fingerprint(abi: ABI) -> str:
+    if not toolchain:
+        probe_toolchain()
 
-def check_cmake() -> None:
-    if os.system("cmake --version") != 0:
-        print("cmake is not installed")
-        exit(4)
+    # other abi's compilers are left out, so enabling another abi doesn't invalidate this one's caches
+    other_abis = {f"{kind}-{other.android_arch_abi_name()}" for other in ABIS if other is not abi for kind in ["cc", "cxx"]}
 
+    hasher = hashlib.sha256()
 
-def check_mason() -> None:
-    if os.system("meson --version") != 0:
-        print("meson is not installed")
-        exit(5)
+    for name, tool in sorted(toolchain.items()):
+        if name not in other_abis:
+            hasher.update(f"{name}={tool["version"]}:{tool["sha256"]}\n".encode())
 
-def check_gawk() -> None:
-    if os.system("gawk --version") != 0:
-        print("gawk is not installed")
-        exit(6)
\ No newline at end of file
+    return hasher.hexdigest()[:16]
@@ -0,0 +1,476 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import re
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from typing import BinaryIO
+
+from constants import *
+from debug_info import debug_bundle_directory, export_debug_info, merge_debug_info
+from dedup import install_tree
+
+# header length, payload length
+MESSAGE_PREFIX = struct.Struct("!IQ")
+
+# payloads smaller than this stay in memory while they're received, bigger ones go to a temporary file
+SPOOL_SIZE: int = 1024 * 1024
+
+# set by the worker for every node, whatever the coordinator says
+WORKER_NODE_OPTIONS: set[str] = {"external_libs", "abis", "skip_ffmpeg"}
+
+# matrix cell namespaces, e.g. static-api28-release
+NAMESPACE = re.compile(r"^[A-Za-z0-9._-]*$")
+
+
+# ------------------------------ protocol ------------------------------
+
+def receive_exactly(connection: socket.socket, length: int) -> bytes:
+    buffer = bytearray()
+
+    while len(buffer) < length:
+        chunk = connection.recv(min(length - len(buffer), 1024 * 1024))
+
+        if not chunk:
+            raise ConnectionError("connection closed in the middle of a message")
+
+        buffer.extend(chunk)
+
+    return bytes(buffer)
+
+
+def send_message(connection: socket.socket, header: dict, payload: BinaryIO | None = None) -> None:
+    encoded_header = json.dumps(header).encode()
+    payload_length = os.fstat(payload.fileno()).st_size if payload is not None else 0
+
+    connection.sendall(MESSAGE_PREFIX.pack(len(encoded_header), payload_length) + encoded_header)
+
+    if payload is not None:
+        payload.seek(0)
+        connection.sendfile(payload)
+
+
+def receive_message(connection: socket.socket) -> tuple[dict, BinaryIO]:
+    # the payload is streamed to a temporary file, the caller closes it
+    header_length, payload_length = MESSAGE_PREFIX.unpack(receive_exactly(connection, MESSAGE_PREFIX.size))
+    header = json.loads(receive_exactly(connection, header_length))
+    payload = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    while payload_length:
+        chunk = connection.recv(min(payload_length, 1024 * 1024))
+
+        if not chunk:
+            payload.close()
+            raise ConnectionError("connection closed in the middle of a message")
+
+        payload.write(chunk)
+        payload_length -= len(chunk)
+
+    payload.seek(0)
+
+    return header, payload
+
+
+def without_git(member: tarfile.TarInfo) -> tarfile.TarInfo | None:
+    # like snapshot_hash, the git metadata isn't part of what gets built
+    return None if os.path.basename(member.name) == ".git" else member
+
+
+def pack_directory(directory: str) -> BinaryIO:
+    # written to a temporary file, a source tree or an install can be far bigger than is worth holding in memory
+    payload = tempfile.TemporaryFile()
+
+    with tarfile.open(fileobj=payload, mode="w:gz", compresslevel=1) as archive:
+        archive.add(directory, arcname=".", filter=without_git)
+
+    payload.seek(0)
+
+    return payload
+
+
+def unpack_directory(payload: BinaryIO, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    payload.seek(0)
+
+    with tarfile.open(fileobj=payload, mode="r:gz") as archive:
+        archive.extractall(directory, filter="data")
+
+
+def snapshot_hash(directory: str) -> str:
+    # content of the source tree, git metadata left out so a fresh clone and a patched one only differ by their files
+    hasher = hashlib.sha256()
+
+    for root, sub_directories, names in os.walk(directory):
+        sub_directories[:] = sorted(sub_directory for sub_directory in sub_directories if sub_directory != ".git")
+
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            hasher.update(os.path.relpath(path, directory).encode() + b"\0")
+
+            if os.path.islink(path):
+                hasher.update(os.readlink(path).encode())
+            else:
+                with open(path, "rb") as file:
+                    hasher.update(hashlib.file_digest(file, "sha256").digest())
+
+    return hasher.hexdigest()
+
+
+# ------------------------------ worker ------------------------------
+
+class WorkerState:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, "worker_state.json")
+        # one build at a time, the build itself already uses all JOBS
+        self.build_lock = threading.Lock()
+
+        # lib -> snapshot of its source, "lib/abi" -> snapshot it was last built from
+        self.snapshots: dict[str, str] = {}
+        self.builds: dict[str, str] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path) as state_file:
+                state = json.load(state_file)
+                self.snapshots = state["snapshots"]
+                self.builds = state["builds"]
+
+    def save(self) -> None:
+        with open(self.path, "w") as state_file:
+            json.dump({"snapshots": self.snapshots, "builds": self.builds}, state_file, indent=2)
+
+
+def node_error(header: dict) -> str | None:
+    # everything the worker puts into paths or command lines, checked before any of it is used
+    if header.get("lib") not in EXTERNAL_LIBS:
+        return f"worker doesn't build {header.get("lib")!r}, it builds {", ".join(EXTERNAL_LIBS)}"
+
+    if header.get("abi") not in {abi.android_arch_abi_name() for abi in ABIS + HOST_ABIS}:
+        return f"unknown abi {header.get("abi")!r}"
+
+    if not isinstance(header.get("snapshot"), str) or not isinstance(header.get("options"), dict) or not all(isinstance(value, str) for value in header["options"].values()):
+        return "malformed build request"
+
+    if ".." in header["options"].get("build_namespace", "") or not NAMESPACE.match(header["options"].get("build_namespace", "")):
+        return f"invalid build namespace {header["options"]["build_namespace"]!r}"
+
+    return None
+
+
+def build_node(state: WorkerState, header: dict, payload: BinaryIO) -> tuple[dict, BinaryIO | None, BinaryIO | None]:
+    error = node_error(header)
+
+    if error is not None:
+        return {"status": "error", "log": error}, None, None
+
+    lib: str = header["lib"]
+    abi_name: str = header["abi"]
+    options: dict[str, str] = header["options"]
+    source_directory = os.path.join(state.directory, "source", lib)
+
+    if header.get("source"):
+        print(f"Receiving {lib} source at snapshot {header["snapshot"][:12]}")
+
+        if os.path.exists(source_directory):
+            shutil.rmtree(source_directory)
+
+        unpack_directory(payload, source_directory)
+        state.snapshots[lib] = header["snapshot"]
+        state.save()
+    elif state.snapshots.get(lib) != header["snapshot"]:
+        return {"status": "error", "log": f"worker doesn't have {lib} source at snapshot {header["snapshot"]}"}, None, None
+
+    log_path = os.path.join(state.directory, "build", f"{lib}-{abi_name}.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    print(f"Building {lib} for {abi_name}, log at {log_path}")
+
+    with open(log_path, "w") as log:
+        result = subprocess.run([sys.executable, MAIN_SCRIPT] + node_args(lib, abi_name, options), cwd=state.directory, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+
+    if result.returncode != 0:
+        with open(log_path) as log:
+            return {"status": "error", "log": "".join(log.readlines()[-50:])}, None, None
+
+    state.builds[f"{lib}/{abi_name}"] = header["snapshot"]
+    state.save()
+
+    # where the node's main.py installed it, the same as INSTALL_ROOT there
+    namespace: str = options.get("build_namespace", "")
+    install_directory = os.path.join(state.directory, "install", namespace, abi_name, lib) if namespace else os.path.join(state.directory, "install", abi_name, lib)
+
+    # with --debug_info the node moved its debug info into install/<abi>.debug next to the install directory, send this library's part of it too
+    bundle_directory = f"{os.path.dirname(install_directory)}.debug"
+    export_directory = os.path.join(state.directory, "build", f"{lib}-{abi_name}-debug")
+    debug_payload: BinaryIO | None = None
+
+    if os.path.exists(export_directory):
+        shutil.rmtree(export_directory)
+
+    if export_debug_info(bundle_directory, lib, export_directory):
+        debug_payload = pack_directory(export_directory)
+        shutil.rmtree(export_directory)
+
+    print(f"Built {lib} for {abi_name}, sending {install_directory}{" and its debug info" if debug_payload is not None else ""}")
+
+    return {"status": "ok", "install_directory": install_directory, "debug_info": debug_payload is not None}, pack_directory(install_directory), debug_payload
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        state: WorkerState = self.server.state
+        authenticated: bool = False
+
+        while True:
+            try:
+                header, payload = receive_message(self.request)
+            except ConnectionError:
+                return
+
+            match header.get("type"):
+                case "hello":
+                    if not hmac.compare_digest(str(header.get("token", "")).encode(), WORKER_TOKEN.encode()):
+                        print(f"Refused coordinator {self.client_address[0]}, wrong worker token")
+                        send_message(self.request, {"status": "error", "log": "wrong worker token"})
+                        return
+
+                    authenticated = True
+                    send_message(self.request, {"status": "ok", "snapshots": state.snapshots, "builds": state.builds})
+                case "build" if authenticated:
+                    with state.build_lock, payload:
+                        reply_header, reply_payload, debug_payload = build_node(state, header, payload)
+
+                    try:
+                        send_message(self.request, reply_header, reply_payload)
+
+                        if debug_payload is not None:
+                            send_message(self.request, {"type": "debug_info"}, debug_payload)
+                    finally:
+                        for reply_file in [reply_payload, debug_payload]:
+                            if reply_file is not None:
+                                reply_file.close()
+                case "build":
+                    send_message(self.request, {"status": "error", "log": "hello with the worker token first"})
+                    return
+                case _:
+                    send_message(self.request, {"status": "error", "log": f"unknown message type {header.get("type")}"})
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve_worker() -> None:
+    host, port = WORKER_LISTEN.rsplit(":", 1)
+
+    # a worker runs whatever build scripts it's sent, only machines that know the token may send them
+    if not WORKER_TOKEN and not is_loopback(host):
+        print(f"Refusing to listen on {host} without a worker token, set WORKER_TOKEN (or --worker_token) on the workers and the coordinator")
+        exit(1)
+
+    os.makedirs(WORKER_DIRECTORY, exist_ok=True)
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+
+    with socketserver.ThreadingTCPServer((host, int(port)), WorkerHandler) as server:
+        server.state = WorkerState(os.path.abspath(WORKER_DIRECTORY))
+
+        print(f"Worker listening on {host}:{port}, building in {server.state.directory}")
+        server.serve_forever()
+
+
+# ------------------------------ coordinator ------------------------------
+
+class Worker:
+    def __init__(self, address: str):
+        self.address = address
+        self.alive = True
+        host, port = address.rsplit(":", 1)
+        self.connection = socket.create_connection((host, int(port)))
+
+        send_message(self.connection, {"type": "hello", "token": WORKER_TOKEN})
+        header, _ = receive_message(self.connection)
+
+        if header["status"] != "ok":
+            raise ConnectionRefusedError(f"Worker {address} refused the connection: {header["log"]}")
+
+        self.snapshots: dict[str, str] = header["snapshots"]
+        self.builds: dict[str, str] = header["builds"]
+
+    # prefer the worker that already built this node, then one holding the source, then one with warm caches for the abi
+    def locality(self, lib: str, abi_name: str, snapshot: str) -> int:
+        score = 0
+
+        if f"{lib}/{abi_name}" in self.builds:
+            score += 4
+
+        if self.snapshots.get(lib) == snapshot:
+            score += 2
+
+        if any(key.endswith(f"/{abi_name}") for key in self.builds):
+            score += 1
+
+        return score
+
+
+def node_options() -> dict[str, str]:
+    # the coordinator's settings, sent with every node so it's built the way ffmpeg here will link it
+    return {name: value for name, value in resolved_options().items() if name not in WORKER_NODE_OPTIONS}
+
+
+def node_args(lib: str, abi_name: str, options: dict[str, str]) -> list[str]:
+    # made on the worker, only settings this script knows are taken from the coordinator, never a mode or anything else
+    known = resolved_options().keys() - WORKER_NODE_OPTIONS
+
+    return child_args(**{name: value for name, value in options.items() if name in known}, external_libs=lib, abis=abi_name, skip_ffmpeg="true")
+
+
+def rewrite_prefix(directory: str, old_prefix: str, new_prefix: str) -> None:
+    # .pc, .la and cmake config files name the install directory they were built for
+    old = old_prefix.encode()
+    new = new_prefix.encode()
+
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if os.path.islink(path):
+                continue
+
+            with open(path, "rb") as file:
+                content = file.read()
+
+            if old in content and b"\0" not in content:
+                with open(path, "wb") as file:
+                    file.write(content.replace(old, new))
+
+
+def build_on_workers(libs: list[str]) -> None:
+    workers: list[Worker] = [Worker(address) for address in WORKERS]
+
+    snapshots: dict[str, str] = {lib: snapshot_hash(os.path.join(CWD, "source", lib)) for lib in libs}
+
+    # every (library, abi) build is independent, ffmpeg is the only thing that needs all of them
+    pending: list[tuple[str, ABI]] = [(lib, abi) for lib in libs for abi in ABIS]
+    pending_lock = threading.Lock()
+    failures: list[str] = []
+
+    print(f"Building {len(pending)} library nodes on {len(workers)} workers")
+
+    def run_worker(worker: Worker) -> None:
+        while True:
+            with pending_lock:
+                if not pending or failures:
+                    return
+
+                node = max(pending, key=lambda candidate: worker.locality(candidate[0], candidate[1].android_arch_abi_name(), snapshots[candidate[0]]))
+                pending.remove(node)
+
+            lib, abi = node
+            abi_name = abi.android_arch_abi_name()
+            snapshot = snapshots[lib]
+
+            install_directory = os.path.join(INSTALL_ROOT, abi_name, lib)
+            # only ship the source if the worker doesn't already have this exact snapshot
+            header = {
+                "type": "build",
+                "lib": lib,
+                "abi": abi_name,
+                "snapshot": snapshot,
+                "source": worker.snapshots.get(lib) != snapshot,
+                "options": node_options()
+            }
+
+            print(f"Sending {lib} for {abi_name} to {worker.address}{" with its source" if header["source"] else ""}")
+
+            try:
+                if header["source"]:
+                    with pack_directory(os.path.join(CWD, "source", lib)) as payload:
+                        send_message(worker.connection, header, payload)
+                else:
+                    send_message(worker.connection, header)
+
+                reply, install_payload = receive_message(worker.connection)
+                debug_payload = receive_message(worker.connection)[1] if reply.get("debug_info") else None
+            except (ConnectionError, OSError) as error:
+                print(f"Lost worker {worker.address} ({error}), giving {lib} for {abi_name} to another worker")
+                worker.alive = False
+
+                with pending_lock:
+                    pending.append(node)
+
+                return
+
+            worker.snapshots[lib] = snapshot
+
+            if reply["status"] != "ok":
+                with pending_lock:
+                    failures.append(f"{lib} for {abi_name} on {worker.address}:\n{reply["log"]}")
+
+                return
+
+            worker.builds[f"{lib}/{abi_name}"] = snapshot
+
+            staging_directory = os.path.join(BUILD_ROOT, abi_name, lib, "worker-install")
+
+            if os.path.exists(staging_directory):
+                shutil.rmtree(staging_directory)
+
+            with install_payload:
+                unpack_directory(install_payload, staging_directory)
+
+            rewrite_prefix(staging_directory, reply["install_directory"], install_directory)
+            install_tree(staging_directory, install_directory)
+            shutil.rmtree(staging_directory)
+
+            if debug_payload is not None:
+                with debug_payload:
+                    unpack_directory(debug_payload, staging_directory)
+
+                merge_debug_info(staging_directory, debug_bundle_directory(abi))
+                shutil.rmtree(staging_directory)
+
+            print(f"Pulled {lib} for {abi_name} back from {worker.address}")
+
+    # a lost worker hands its node back after the others may have already run out of work, so go again until nothing is left
+    while pending and not failures and any(worker.alive for worker in workers):
+        threads = [threading.Thread(target=run_worker, args=(worker,)) for worker in workers if worker.alive]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    for worker in workers:
+        worker.connection.close()
+
+    if failures:
+        raise ChildProcessError("Builds failed on workers:\n" + "\n".join(failures))
+
+    if pending:
+        raise ChildProcessError(f"No workers left for {", ".join(f"{lib} for {abi.android_arch_abi_name()}" for lib, abi in pending)}")
+
+    # same flags the recipes add, in library order so ffmpeg's configure line doesn't depend on which worker finished first
+    for lib in libs:
+        for abi in ABIS:
+            install_directory = os.path.join(INSTALL_ROOT, abi.android_arch_abi_name(), lib)
+
+            with abi.c_flags_lock, abi.ld_flags_lock, abi.pkg_config_paths_lock:
+                abi.c_flags.append(f"-I{install_directory}/include")
+                abi.ld_flags.append(f"-L{install_directory}/lib")
+                abi.pkg_config_paths.append(os.path.join(install_directory, "lib", "pkgconfig"))
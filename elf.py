@@ -0,0 +1,335 @@
+import mmap
+import os
+import struct
+
+ELF_MAGIC = b"\x7fELF"
+AR_MAGIC = b"!<arch>\n"
+THIN_AR_MAGIC = b"!<thin>\n"
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+EM_386 = 3
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+SHT_NOBITS = 8
+SHT_REL = 9
+SHT_DYNSYM = 11
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+SHN_UNDEF = 0
+SHN_ABS = 0xfff1
+SHN_COMMON = 0xfff2
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_SECTION = 3
+STT_FILE = 4
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_TEXTREL = 22
+DT_FLAGS = 30
+DF_TEXTREL = 0x4
+
+NT_GNU_BUILD_ID = 3
+
+# absolute relocations against code, each one becomes a text relocation once the object is linked into a shared library
+ABSOLUTE_CODE_RELOCATIONS: dict[int, set[int]] = {
+    EM_386: {1},
+    EM_ARM: {2, 43, 44},
+    EM_X86_64: {1, 10, 11},
+    EM_AARCH64: {257, 258, 263, 264, 265, 266, 267, 268, 269}
+}
+
+
+class Section:
+    def __init__(self, name: str, type: int, flags: int, offset: int, size: int, link: int, info: int, entsize: int):
+        self.name = name
+        self.type = type
+        self.flags = flags
+        self.offset = offset
+        self.size = size
+        self.link = link
+        self.info = info
+        self.entsize = entsize
+
+
+class Symbol:
+    def __init__(self, name: str, value: int, size: int, info: int, shndx: int):
+        self.name = name
+        self.value = value
+        self.size = size
+        self.bind = info >> 4
+        self.type = info & 0xf
+        self.shndx = shndx
+
+    def defined(self) -> bool:
+        return self.shndx != SHN_UNDEF
+
+
+class ProgramHeader:
+    def __init__(self, type: int, offset: int, vaddr: int, filesz: int, memsz: int, flags: int, align: int):
+        self.type = type
+        self.offset = offset
+        self.vaddr = vaddr
+        self.filesz = filesz
+        self.memsz = memsz
+        self.flags = flags
+        self.align = align
+
+
+# an elf file inside a buffer (usually a mmap), at an offset so archive members can be read in place
+class ElfFile:
+    def __init__(self, data, offset: int = 0, name: str = ""):
+        if data[offset:offset + 4] != ELF_MAGIC:
+            raise ValueError(f"{name} is not an elf file")
+
+        self.data = data
+        self.base = offset
+        self.name = name
+
+        self.is_64 = data[offset + 4] == 2
+        self.endian = "<" if data[offset + 5] == 1 else ">"
+
+        if self.is_64:
+            (self.type, self.machine, _, _, self.phoff, self.shoff, _, _, self.phentsize, self.phnum, self.shentsize, self.shnum, self.shstrndx) = struct.unpack_from(f"{self.endian}HHIQQQIHHHHHH", data, offset + 16)
+        else:
+            (self.type, self.machine, _, _, self.phoff, self.shoff, _, _, self.phentsize, self.phnum, self.shentsize, self.shnum, self.shstrndx) = struct.unpack_from(f"{self.endian}HHIIIIIHHHHHH", data, offset + 16)
+
+        self.sections: list[Section] = self.read_sections()
+
+    def read_sections(self) -> list[Section]:
+        if self.shoff == 0 or self.shnum == 0:
+            return []
+
+        layout = f"{self.endian}IIQQQQIIQQ" if self.is_64 else f"{self.endian}IIIIIIIIII"
+        raw = [struct.unpack_from(layout, self.data, self.base + self.shoff + index * self.shentsize) for index in range(self.shnum)]
+
+        names = raw[self.shstrndx]
+        names_offset = names[4]
+
+        sections: list[Section] = []
+
+        for name, type, flags, _, offset, size, link, info, _, entsize in raw:
+            sections.append(Section(self.string(names_offset, name), type, flags, offset, size, link, info, entsize))
+
+        return sections
+
+    def string(self, table_offset: int, index: int) -> str:
+        start = self.base + table_offset + index
+        end = self.data.find(b"\0", start)
+
+        return bytes(self.data[start:end]).decode(errors="replace")
+
+    def bytes(self, offset: int, size: int) -> bytes:
+        return bytes(self.data[self.base + offset:self.base + offset + size])
+
+    def program_headers(self) -> list[ProgramHeader]:
+        if self.phoff == 0:
+            return []
+
+        result: list[ProgramHeader] = []
+
+        for index in range(self.phnum):
+            position = self.base + self.phoff + index * self.phentsize
+
+            if self.is_64:
+                type, flags, offset, vaddr, _, filesz, memsz, align = struct.unpack_from(f"{self.endian}IIQQQQQQ", self.data, position)
+            else:
+                type, offset, vaddr, _, filesz, memsz, flags, align = struct.unpack_from(f"{self.endian}IIIIIIII", self.data, position)
+
+            result.append(ProgramHeader(type, offset, vaddr, filesz, memsz, flags, align))
+
+        return result
+
+    def symbols(self, dynamic: bool = False) -> list[Symbol]:
+        wanted = SHT_DYNSYM if dynamic else SHT_SYMTAB
+
+        for section in self.sections:
+            if section.type != wanted or section.entsize == 0:
+                continue
+
+            strings = self.bytes(self.sections[section.link].offset, self.sections[section.link].size)
+            table = self.bytes(section.offset, section.size)
+
+            result: list[Symbol] = []
+
+            if self.is_64:
+                for name, info, _, shndx, value, size in struct.iter_unpack(f"{self.endian}IBBHQQ", table):
+                    result.append(Symbol(strings[name:strings.find(b"\0", name)].decode(errors="replace"), value, size, info, shndx))
+            else:
+                for name, value, size, info, _, shndx in struct.iter_unpack(f"{self.endian}IIIBBH", table):
+                    result.append(Symbol(strings[name:strings.find(b"\0", name)].decode(errors="replace"), value, size, info, shndx))
+
+            return result
+
+        return []
+
+    def dynamic(self) -> list[tuple[int, int]]:
+        for section in self.sections:
+            if section.type != SHT_DYNAMIC:
+                continue
+
+            layout = f"{self.endian}qQ" if self.is_64 else f"{self.endian}iI"
+            entries: list[tuple[int, int]] = []
+
+            for tag, value in struct.iter_unpack(layout, self.bytes(section.offset, section.size)):
+                if tag == DT_NULL:
+                    break
+
+                entries.append((tag, value))
+
+            return entries
+
+        return []
+
+    def needed(self) -> list[str]:
+        entries = self.dynamic()
+        strings = next((section for section in self.sections if section.type == SHT_DYNAMIC), None)
+
+        if strings is None:
+            return []
+
+        string_table = self.sections[strings.link]
+
+        return [self.string(string_table.offset, value) for tag, value in entries if tag == DT_NEEDED]
+
+    def has_text_relocations(self) -> bool:
+        return any(tag == DT_TEXTREL or (tag == DT_FLAGS and value & DF_TEXTREL) for tag, value in self.dynamic())
+
+    def absolute_code_relocations(self) -> int:
+        types = ABSOLUTE_CODE_RELOCATIONS.get(self.machine, set())
+        count = 0
+
+        for section in self.sections:
+            if section.type not in (SHT_REL, SHT_RELA) or section.entsize == 0 or section.info >= len(self.sections):
+                continue
+
+            target = self.sections[section.info]
+
+            if not target.flags & SHF_EXECINSTR or target.flags & SHF_WRITE:
+                continue
+
+            table = self.bytes(section.offset, section.size)
+
+            # only the type is needed, on little endian files it's read with a strided slice instead of unpacking every entry
+            if self.endian == "<" and self.is_64:
+                relocation_types = memoryview(table).cast("I")[2::section.entsize // 4].tolist()
+            elif self.endian == "<":
+                relocation_types = table[4::section.entsize]
+            elif self.is_64:
+                relocation_types = [info & 0xffffffff for _, info, *_ in struct.iter_unpack(f">QQ{"q" if section.type == SHT_RELA else ""}", table)]
+            else:
+                relocation_types = [info & 0xff for _, info, *_ in struct.iter_unpack(f">II{"i" if section.type == SHT_RELA else ""}", table)]
+
+            count += sum(map(types.__contains__, relocation_types))
+
+        return count
+
+    def build_id(self) -> str | None:
+        for section in self.sections:
+            if section.type != SHT_NOTE:
+                continue
+
+            note = self.bytes(section.offset, section.size)
+            position = 0
+
+            while position + 12 <= len(note):
+                name_size, description_size, note_type = struct.unpack_from(f"{self.endian}III", note, position)
+                name_start = position + 12
+                description_start = name_start + ((name_size + 3) & ~3)
+
+                if note_type == NT_GNU_BUILD_ID and note[name_start:name_start + name_size].rstrip(b"\0") == b"GNU":
+                    return note[description_start:description_start + description_size].hex()
+
+                position = description_start + ((description_size + 3) & ~3)
+
+        return None
+
+
+class ArchiveMember:
+    def __init__(self, name: str, offset: int, size: int):
+        self.name = name
+        self.offset = offset
+        self.size = size
+
+
+def archive_members(data) -> list[ArchiveMember]:
+    if data[:8] != AR_MAGIC:
+        raise ValueError("not an ar archive")
+
+    members: list[ArchiveMember] = []
+    long_names: bytes = b""
+    position = 8
+
+    while position + 60 <= len(data):
+        header = bytes(data[position:position + 60])
+        name = header[:16].decode(errors="replace").rstrip()
+        size = int(header[48:58].decode().strip())
+        content = position + 60
+
+        if name == "//":
+            # gnu long name table
+            long_names = bytes(data[content:content + size])
+        elif name in ("/", "/SYM64/", "__.SYMDEF", "__.SYMDEF SORTED"):
+            # symbol index
+            pass
+        else:
+            if name.startswith("#1/"):
+                # bsd long names are stored in front of the content
+                name_length = int(name[3:])
+                name = bytes(data[content:content + name_length]).decode(errors="replace").rstrip("\0")
+                content += name_length
+                size -= name_length
+            elif name.startswith("/") and name[1:].isdigit():
+                start = int(name[1:])
+                name = long_names[start:long_names.index(b"\n", start)].decode(errors="replace")
+
+            members.append(ArchiveMember(name.rstrip("/"), content, size))
+
+        # members are 2 byte aligned
+        position = position + 60 + int(header[48:58].decode().strip())
+        position += position & 1
+
+    return members
+
+
+def open_mapped(path: str) -> mmap.mmap | None:
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def elf_files(path: str, data) -> list[ElfFile]:
+    # every elf file in a static archive, or the file itself
+    if data[:8] == AR_MAGIC:
+        return [ElfFile(data, member.offset, f"{path}({member.name})") for member in archive_members(data) if data[member.offset:member.offset + 4] == ELF_MAGIC]
+
+    if data[:4] == ELF_MAGIC:
+        return [ElfFile(data, 0, path)]
+
+    return []
+
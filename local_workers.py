@@ -0,0 +1,76 @@
+import secrets
+import socket
+import subprocess
+import time
+
+from constants import *
+
+# each worker gets its own directory for sources, builds and caches, like it would on its own machine
+LOCAL_WORKERS_ROOT: str = os.path.join(CWD, "local_workers")
+
+# seconds to wait for a worker to start listening
+STARTUP_TIMEOUT: float = 30
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_worker(address: str, process: subprocess.Popen, log_path: str) -> None:
+    host, port = address.rsplit(":", 1)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+
+    while True:
+        if process.poll() is not None:
+            raise ChildProcessError(f"Worker {address} exited with code {process.returncode}, see {log_path}")
+
+        try:
+            socket.create_connection((host, int(port)), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Worker {address} didn't start listening in {STARTUP_TIMEOUT}s, see {log_path}")
+
+            time.sleep(0.1)
+
+
+def run_local_workers() -> None:
+    # the whole distributed path (source shipping, scheduling, pulling installs back) with every worker on this machine
+    addresses: list[str] = []
+    processes: list[subprocess.Popen] = []
+
+    # a fresh token per run, through the environment so it isn't in the process list
+    env = os.environ | {"WORKER_TOKEN": WORKER_TOKEN or secrets.token_hex()}
+
+    try:
+        for index in range(LOCAL_WORKERS):
+            address = f"127.0.0.1:{free_port()}"
+            directory = os.path.join(LOCAL_WORKERS_ROOT, f"worker-{index}")
+            log_path = os.path.join(LOCAL_WORKERS_ROOT, f"worker-{index}.log")
+
+            os.makedirs(directory, exist_ok=True)
+
+            print(f"Starting local worker {index} on {address} in {directory}, log at {log_path}")
+
+            with open(log_path, "w") as log:
+                process = subprocess.Popen(child_command(worker_listen=address, worker_directory=directory), stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+            processes.append(process)
+            wait_for_worker(address, process, log_path)
+            addresses.append(address)
+
+        subprocess.run(child_command(workers=",".join(addresses)), env=env, check=True)
+    finally:
+        for process in processes:
+            process.terminate()
+
+        for process in processes:
+            process.wait()
+
+    print(f"Success, built with {LOCAL_WORKERS} local workers")
+
+
+if __name__ == "__main__":
+    run_local_workers()
@@ -1,9 +1,18 @@
-import shutil
 import subprocess
 import threading
 
+from benchmark import benchmark
+from configure_cache import cmake_initial_cache, record_cmake_probes, run_autoconf_configure
 from constants import *
-from dependencies import check_cmake, check_mason, check_pkg_config, check_gawk
+from dedup import install_tree, prune_objects, staged_install
+from dependencies import probe_toolchain
+from distributed import build_on_workers, serve_worker
+from matrix import fetch_sources, run_matrix
+from reproducible import check_reproducible, configuration_snapshot, relocate_configuration
+from size_report import size_report
+from time_trace import MAKE_SHELL, MAKE_TIME_LOG, time_trace_report
+from verify import verify
+from watch import watch
 
 library_flags_lock = threading.Lock()
 library_flags: list[str] = []
@@ -15,18 +24,27 @@ def build_using_cmake(abi: ABI, lib_name: str, build_directory: str, install_dir
         "cmake",
         f"-S {source_directory}",
         f"-B {build_directory}",
-        f"-DCMAKE_TOOLCHAIN_FILE={NDK_PATH}/build/cmake/android.toolchain.cmake",
-        "-DCMAKE_SYSTEM_NAME=Android",
-        f"-DCMAKE_ANDROID_NDK={NDK_PATH}",
-        f"-DANDROID_ABI={abi_name}",
-        f"-DANDROID_PLATFORM=android-{API}",
-        f"-DCMAKE_ANDROID_ARCH_ABI={abi_name}",
-        f"-DCMAKE_ANDROID_API={API}",
         f"-DCMAKE_INSTALL_PREFIX={install_directory}",
         f"-DCMAKE_BUILD_TYPE={EXTERNAL_LIB_BUILD_TYPE}",
         "-DCMAKE_POSITION_INDEPENDENT_CODE=ON"
     ]
 
+    if abi.host:
+        cmake_commands.extend([
+            f"-DCMAKE_C_COMPILER={abi.cc}",
+            f"-DCMAKE_CXX_COMPILER={abi.cxx}"
+        ])
+    else:
+        cmake_commands.extend([
+            f"-DCMAKE_TOOLCHAIN_FILE={NDK_PATH}/build/cmake/android.toolchain.cmake",
+            "-DCMAKE_SYSTEM_NAME=Android",
+            f"-DCMAKE_ANDROID_NDK={NDK_PATH}",
+            f"-DANDROID_ABI={abi_name}",
+            f"-DANDROID_PLATFORM=android-{API}",
+            f"-DCMAKE_ANDROID_ARCH_ABI={abi_name}",
+            f"-DCMAKE_ANDROID_API={API}"
+        ])
+
     if specific_flags is not None:
         cmake_commands.extend(specific_flags)
 
@@ -35,6 +53,31 @@ def build_using_cmake(abi: ABI, lib_name: str, build_directory: str, install_dir
     else:
         cmake_commands.append("-DBUILD_SHARED_LIBS=ON")
 
+    # add_compile_options() after every project(), so the toolchain's own CMAKE_C_FLAGS are left alone, and written every time so turning a flag off takes it back out
+    os.makedirs(build_directory, exist_ok=True)
+    common_flags_path: str = os.path.join(build_directory, "common_flags.cmake")
+
+    with open(common_flags_path, "w") as common_flags_file:
+        for flag in abi.common_c_flags:
+            common_flags_file.write(f"add_compile_options(\"$<$<COMPILE_LANGUAGE:C,CXX>:{flag}>\")\n")
+
+        for flag in abi.common_ld_flags:
+            common_flags_file.write(f"add_link_options(\"{flag}\")\n")
+
+    cmake_commands.append(f"-DCMAKE_PROJECT_INCLUDE={common_flags_path}")
+
+    # always given, an empty launcher takes it back out of a reconfigured build
+    cmake_commands.extend([
+        f"-DCMAKE_C_COMPILER_LAUNCHER={";".join(abi.launcher)}",
+        f"-DCMAKE_CXX_COMPILER_LAUNCHER={";".join(abi.launcher)}"
+    ])
+
+    # preload feature probe results from earlier configures of this library with the same toolchain
+    initial_cache: str | None = cmake_initial_cache(abi, lib_name)
+
+    if initial_cache is not None:
+        cmake_commands.extend(["-C", initial_cache])
+
     env = os.environ.copy()
 
     if pkg_config_paths is not None:
@@ -44,11 +87,13 @@ def build_using_cmake(abi: ABI, lib_name: str, build_directory: str, install_dir
     print(f"Configuring {lib_name} for {abi_name} using cmake")
     subprocess.run(cmake_commands, env=env, check=True)
 
+    record_cmake_probes(abi, lib_name, build_directory)
+
     print(f"Building {lib_name} for {abi_name} at {build_directory} using cmake")
     subprocess.run(["cmake", "--build", build_directory, f"-j{JOBS}"], check=True)
 
     print(f"Installing {lib_name} for {abi_name} to {install_directory} using cmake")
-    subprocess.run(["cmake", "--install", build_directory], check=True)
+    staged_install(["cmake", "--install", build_directory], build_directory, install_directory)
 
     print(f"Configured, Built, and Installed {lib_name} for {abi_name} using cmake")
 
@@ -60,12 +105,12 @@ def build_using_cmake(abi: ABI, lib_name: str, build_directory: str, install_dir
 
 
 def build_using_meson(abi: ABI, lib_name: str, build_directory: str, install_directory: str, source_directory: str, specific_flags: list[str] | None = None, pkg_config_paths: list[str] | None = None) -> None:
-    gen_meson_files()
-
     cross_file = f"android-{NDK_VERSION}-"
 
     abi_name = abi.android_arch_abi_name()
 
+    env = os.environ.copy()
+
     match abi_name:
         case "armeabi-v7a":
             cross_file += f"androideabi{API}-armv7a-cross.txt"
@@ -80,11 +125,42 @@ def build_using_meson(abi: ABI, lib_name: str, build_directory: str, install_dir
         "meson",
         "setup",
         f"--prefix={install_directory}",
-        f"--cross-file={os.path.join(CWD, "build", "meson_cross_files", cross_file)}",
         f"--buildtype={EXTERNAL_LIB_BUILD_TYPE.lower()}",
         "--reconfigure"
     ]
 
+    if abi.host:
+        # a native build, meson takes the host compilers from the environment
+        env.update({
+            "CC": abi.launched(abi.cc),
+            "CXX": abi.launched(abi.cxx)
+        })
+    else:
+        cross_file_path: str = os.path.join(CWD, "build", "meson_cross_files", cross_file)
+
+        # shared by every matrix cell, so only make them when they are missing
+        if not os.path.exists(cross_file_path):
+            gen_meson_files()
+
+        meson_commands.append(f"--cross-file={cross_file_path}")
+
+        # a later cross file overrides the compilers of the shared one, written every time so turning the launcher off takes it back out
+        os.makedirs(build_directory, exist_ok=True)
+        launcher_file_path: str = os.path.join(build_directory, "launcher_cross.txt")
+
+        with open(launcher_file_path, "w") as launcher_file:
+            launcher_file.write(f"[binaries]\nc = {abi.launcher + [abi.cc]!r}\ncpp = {abi.launcher + [abi.cxx]!r}\n")
+
+        meson_commands.append(f"--cross-file={launcher_file_path}")
+
+    # always given, so turning a flag off takes it back out of a reconfigured build
+    meson_commands.extend([
+        f"-Dc_args={abi.common_c_flags!r}",
+        f"-Dcpp_args={abi.common_c_flags!r}",
+        f"-Dc_link_args={abi.common_ld_flags!r}",
+        f"-Dcpp_link_args={abi.common_ld_flags!r}"
+    ])
+
     if STATIC_BUILD:
         meson_commands.append("--default-library=static")
     else:
@@ -98,8 +174,6 @@ def build_using_meson(abi: ABI, lib_name: str, build_directory: str, install_dir
         source_directory
     ])
 
-    env = os.environ.copy()
-
     if pkg_config_paths is not None:
         env["PKG_CONFIG_PATH"] = ":".join(pkg_config_paths)
         env["PKG_CONFIG_LIBDIR"] = ":".join(pkg_config_paths)
@@ -113,7 +187,7 @@ def build_using_meson(abi: ABI, lib_name: str, build_directory: str, install_dir
     subprocess.run(["meson", "compile"], check=True)
 
     print(f"Installing {lib_name} for {abi_name} to {install_directory} using meson")
-    subprocess.run(["meson", "install"], check=True)
+    staged_install(["meson", "install"], build_directory, install_directory)
 
     print(f"Setup, Compiled, and Installed {lib_name} for {abi_name} using meson")
 
@@ -130,7 +204,26 @@ def gen_meson_files() -> None:
 
 
 def main():
-    check_pkg_config()
+    # workers get their settings from the coordinator with every build they're sent
+    if WORKER_LISTEN:
+        serve_worker()
+        return
+
+    # the check's two builds live in one reproducible/ directory that cells running side by side would share
+    if MATRIX and REPRODUCIBLE_CHECK:
+        print("Matrix builds and the reproducibility check can't be combined, run the check for one cell on its own with its --static_build, --android_api and --external_lib_build_type")
+        exit(1)
+
+    # fail before building anything if a tool is missing, and fingerprint the toolchain for the caches
+    probe_toolchain()
+
+    if MATRIX:
+        run_matrix()
+        return
+
+    if REPRODUCIBLE_CHECK:
+        check_reproducible()
+        return
 
     # env variables to make sure not to exceed jobs count
     os.environ.update({
@@ -139,9 +232,74 @@ def main():
         "NINJAFLAGS": f"-j{JOBS}"
     })
 
+    # one compiler cache for every run and matrix cell, paths under the checkout are hashed relative to it so different build directories still hit
+    if COMPILER_CACHE:
+        os.environ.update({
+            "CCACHE_DIR": os.path.join(CACHE_ROOT, "ccache"),
+            "CCACHE_BASEDIR": CWD
+        })
+
+    # __DATE__, __TIME__ and anything else that asks for the build time
+    if REPRODUCIBLE:
+        os.environ["SOURCE_DATE_EPOCH"] = SOURCE_DATE_EPOCH
+
+    # every make, including the ones cmake and libtool start, runs its recipes through make_shell.py to time them
+    if TIME_TRACE:
+        # make splits SHELL on whitespace and expands $ in it, there's no quoting that every make in the build honours
+        if any(character.isspace() or character in "$#\\'\"" for character in MAKE_SHELL):
+            print(f"Time tracing can't run make's recipes through {MAKE_SHELL}, make can't take a shell path with spaces or special characters in it, move the checkout or turn off --time_trace")
+            exit(1)
+
+        os.makedirs(os.path.dirname(MAKE_TIME_LOG), exist_ok=True)
+
+        # only this run's steps, the report keeps the last entry of every output and would mix in older runs
+        if not FETCH_ONLY:
+            open(MAKE_TIME_LOG, "w").close()
+
+        os.environ.update({
+            "MAKEFLAGS": f"-j{JOBS} SHELL={MAKE_SHELL}",
+            "MAKE_TIME_LOG": MAKE_TIME_LOG
+        })
+
     # ffmpeg_libs()
     libraries()
-    ffmpeg()
+
+    if not SKIP_FFMPEG:
+        ffmpeg()
+
+        if VERIFY and not FETCH_ONLY:
+            verify()
+
+        if SIZE_REPORT and not FETCH_ONLY:
+            size_report()
+
+        if BENCHMARK and not FETCH_ONLY:
+            benchmark()
+
+    if TIME_TRACE and not FETCH_ONLY:
+        time_trace_report()
+
+    # objects of files this build replaced
+    if DEDUP_INSTALLS and not FETCH_ONLY:
+        prune_objects()
+
+    if WATCH:
+        watch()
+
+
+def target_flags(abi: ABI) -> list[str]:
+    # the host build links the c++ libraries against the host's c++ runtime instead of the ndk's
+    if abi.host:
+        return [
+            "--extra-libs=-lstdc++"
+        ]
+
+    return [
+        "--target-os=android",
+        "--enable-cross-compile",
+        "--sysroot=" + os.path.join(toolchain_path, "sysroot"),
+        "--extra-libs=-lc++"
+    ]
 
 
 def ffmpeg_libs() -> None:
@@ -153,28 +311,27 @@ def ffmpeg_libs() -> None:
         if os.system(f"git clone --branch n{FFMPEG_VERSION} https://github.com/FFmpeg/FFmpeg.git {source_directory}") != 0:
             raise ChildProcessError("git clone of ffmpeg failed")
 
+    if FETCH_ONLY:
+        return
+
     # build for each abi
     for abi in ABIS:
         abi_name: str = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", abi_name, "ffmpeg")
-        install_directory: str = os.path.join(CWD, "install", abi_name, "ffmpeg")
+        build_directory: str = os.path.join(BUILD_ROOT, abi_name, "ffmpeg")
+        install_directory: str = os.path.join(INSTALL_ROOT, abi_name, "ffmpeg")
         configure_directory = f"{source_directory}/configure"
 
         configure_commands: list[str] = [
                                configure_directory,
-                               "--target-os=android",
-                               "--enable-cross-compile",
-                               "--nm=" + os.path.join(toolchain_path, "bin", "llvm-nm"),
-                               "--ar=" + os.path.join(toolchain_path, "bin", "llvm-ar"),
-                               "--sysroot=" + os.path.join(toolchain_path, "sysroot"),
-                               "--ranlib=" + os.path.join(toolchain_path, "bin", "llvm-ranlib"),
-                               "--strip=" + os.path.join(toolchain_path, "bin", "llvm-strip"),
+                               "--nm=" + abi.tool("llvm-nm"),
+                               "--ar=" + abi.tool("llvm-ar"),
+                               "--ranlib=" + abi.tool("llvm-ranlib"),
+                               "--strip=" + abi.tool("llvm-strip"),
                                "--pkg-config=pkg-config",
-                               "--extra-libs=-lc++",
                                f"--prefix={install_directory}",
                                "--disable-programs"
-                           ] + abi.command()
+                           ] + target_flags(abi) + abi.command()
 
         if STATIC_BUILD:
             configure_commands.extend([
@@ -195,14 +352,20 @@ def ffmpeg_libs() -> None:
 
         os.chdir(build_directory)
 
+        config_header: str = os.path.join(build_directory, "config.h")
+        previous_configuration = configuration_snapshot(config_header)
+
         print(f"Configuring ffmpeg libs for {abi_name}")
         subprocess.run(configure_commands, check=True)
 
+        if REPRODUCIBLE:
+            relocate_configuration(config_header, previous_configuration)
+
         print(f"Making ffmpeg libs for {abi_name} at {build_directory}")
         subprocess.run(["make", f"-j{JOBS}"], check=True)
 
         print(f"Installing ffmpeg libs for {abi_name} to {install_directory}")
-        subprocess.run(["make", "install"], check=True)
+        staged_install(["make", "install"], build_directory, install_directory)
 
         print(f"Finished Configuring, Making, Installing ffmpeg libs for {abi_name}")
 
@@ -213,40 +376,49 @@ def libraries() -> None:
     v3: bool = False
     gpl: bool = False
 
-    # loop through libraries, calling its function
-    for lib in EXTERNAL_LIBS:
-        match lib:
-            case "libaom":
-                libaom()
-            case "amf":
-                amf()
-            case "avisynth":
-                avisynth()
-                gpl = True
-            case "chromaprint":
-                chromaprint()
-            case "libcodec2":
-                libcodec2()
-            case "libdav1d":
-                libdav1d()
-            case "libuavs3d":
-                libuavs3d()
-            case "libdavs2":
-                libdavs2()
-                gpl = True
-            case "libgme":
-                libgme()
-            case "libkvazaar":
-                libkvazaar()
-            case "libmp3lame":
-                libmp3lame()
-            case _:
-                raise RuntimeError(f"Unsupported External Library: {lib}")
+    if WORKERS and not FETCH_ONLY:
+        distributed_libraries()
 
+        # same licences the recipes below ask for
+        gpl = any(lib in ["avisynth", "libdavs2"] for lib in EXTERNAL_LIBS)
+    else:
+        # loop through libraries, calling its function
+        for lib in EXTERNAL_LIBS:
+            match lib:
+                case "libaom":
+                    libaom()
+                case "amf":
+                    amf()
+                case "avisynth":
+                    avisynth()
+                    gpl = True
+                case "chromaprint":
+                    chromaprint()
+                case "libcodec2":
+                    libcodec2()
+                case "libdav1d":
+                    libdav1d()
+                case "libuavs3d":
+                    libuavs3d()
+                case "libdavs2":
+                    libdavs2()
+                    gpl = True
+                case "libgme":
+                    libgme()
+                case "libkvazaar":
+                    libkvazaar()
+                case "libmp3lame":
+                    libmp3lame()
+                case _:
+                    raise RuntimeError(f"Unsupported External Library: {lib}")
+
+    # nothing gets linked against the libraries yet, the licences only matter for ffmpeg
+    if FETCH_ONLY or SKIP_FFMPEG:
+        return
 
     # add licencing flags if needed
     if v3:
-        if not AUTO_ACCEPT_LICENCE or input("License must be upgraded to v3 to continue. Continue? [y/n]: ").strip().lower() == "n":
+        if not AUTO_ACCEPT_LICENCE and input("License must be upgraded to v3 to continue. Continue? [y/n]: ").strip().lower() == "n":
             print("Cannot continue, user refused to upgrade license to v3")
             exit(1)
 
@@ -254,7 +426,7 @@ def libraries() -> None:
             library_flags.append("--enable-version3")
 
     if gpl:
-        if not AUTO_ACCEPT_LICENCE or input("License must be upgraded to gpl to continue. Continue? [y/n]: ").strip().lower() == "n":
+        if not AUTO_ACCEPT_LICENCE and input("License must be upgraded to gpl to continue. Continue? [y/n]: ").strip().lower() == "n":
             print("Cannot continue, user refused to upgrade license to gpl")
             exit(2)
 
@@ -262,8 +434,23 @@ def libraries() -> None:
             library_flags.append("--enable-gpl")
 
 
+def distributed_libraries() -> None:
+    # the workers build from the sources here, so get them first
+    fetch_sources()
+
+    # amf is only headers, nothing to build
+    if "amf" in EXTERNAL_LIBS:
+        amf()
+
+    libs: list[str] = [lib for lib in EXTERNAL_LIBS if lib != "amf"]
+
+    build_on_workers(libs)
+
+    with library_flags_lock:
+        library_flags.extend(f"--enable-{lib}" for lib in libs)
+
+
 def libaom() -> None:
-    check_cmake()
     source_directory: str = os.path.join(CWD, "source", "libaom")
 
     # get source code if it's not alr there
@@ -272,13 +459,16 @@ def libaom() -> None:
         if os.system(f"git clone --branch v{LIBAOM_VERSION} https://aomedia.googlesource.com/aom {source_directory}") != 0:
             raise ChildProcessError("git clone of libaom failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name: str = abi.android_arch_abi_name()
         libaom_abi_name: str = abi.libaom_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libaom")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libaom")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libaom")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libaom")
 
         build_using_cmake(abi, "libaom", build_directory, install_directory, source_directory, [
             "-DENABLE_EXAMPLES=OFF",
@@ -302,25 +492,27 @@ def amf() -> None:
         if os.system(f"git clone --branch v{AMF_VERSION} https://github.com/GPUOpen-LibrariesAndSDKs/AMF.git {source_directory}") != 0:
             raise ChildProcessError("git clone of amf failed")
 
-    install_directory = os.path.join(CWD, "install", "all_architectures", "AMF")
+    if FETCH_ONLY:
+        return
+
+    install_directory = os.path.join(INSTALL_ROOT, "all_architectures", "AMF")
 
     print("Making install directory for amf")
     os.makedirs(install_directory, exist_ok=True)
 
     print("Copying amf headers to install directory")
-    shutil.copytree(src=os.path.join(source_directory, "amf", "public", "include"), dst=install_directory, dirs_exist_ok=True)
+    install_tree(os.path.join(source_directory, "amf", "public", "include"), install_directory)
 
     print("Finished 'installing' amf")
     # put c_flags for all abis
     for abi in ABIS:
-        abi.c_flags.append(f"-I{os.path.join(CWD, "install", "all_architectures")}")
+        abi.c_flags.append(f"-I{os.path.join(INSTALL_ROOT, "all_architectures")}")
 
     with library_flags_lock:
         library_flags.append("--enable-amf")
 
 
 def avisynth() -> None:
-    check_cmake()
     source_directory: str = os.path.join(CWD, "source", "avisynth")
 
     if not os.path.exists(source_directory):
@@ -328,14 +520,17 @@ def avisynth() -> None:
         if os.system(f"git clone --branch v{AVISYNTH_VERSION} https://github.com/AviSynth/AviSynthPlus.git {source_directory}") != 0:
             raise ChildProcessError("git clone of avisynth failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "avisynth")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "avisynth")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "avisynth")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "avisynth")
 
-        if android_abi_name == "x86_64":
+        if abi.arch == "x86_64":
             build_using_cmake(abi, "avisynth", build_directory, install_directory, source_directory, [
                 "-DENABLE_PLUGINS=OFF",
                 "-DENABLE_CUDA=OFF",
@@ -353,7 +548,6 @@ def avisynth() -> None:
 
 
 def chromaprint() -> None:
-    check_cmake()
     source_directory: str = os.path.join(CWD, "source", "chromaprint")
 
     if not os.path.exists(source_directory):
@@ -361,12 +555,15 @@ def chromaprint() -> None:
         if os.system(f"git clone --branch v{CHROMAPRINT_VERSION} https://github.com/acoustid/chromaprint.git {source_directory}") != 0:
             raise ChildProcessError("git clone of chromaprint failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "chromaprint")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "chromaprint")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "chromaprint")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "chromaprint")
 
         build_using_cmake(abi, "chromaprint", build_directory, install_directory, source_directory, [
             "-DBUILD_TOOLS=OFF",
@@ -379,7 +576,6 @@ def chromaprint() -> None:
 
 
 def libcodec2() -> None:
-    check_cmake()
     source_directory: str = os.path.join(CWD, "source", "libcodec2")
 
     if not os.path.exists(source_directory):
@@ -387,12 +583,15 @@ def libcodec2() -> None:
         if os.system(f"git clone --branch {LIBCODEC2_VERSION} https://github.com/drowe67/codec2.git {source_directory}") != 0:
             raise ChildProcessError("git clone of libcodec2 failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libcodec2")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libcodec2")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libcodec2")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libcodec2")
 
         build_using_cmake(abi, "libcodec2", build_directory, install_directory, source_directory, [
             "-DUNITTEST=OFF"
@@ -403,7 +602,6 @@ def libcodec2() -> None:
 
 
 def libdav1d() -> None:
-    check_mason()
     source_directory: str = os.path.join(CWD, "source", "libdav1d")
 
     if not os.path.exists(source_directory):
@@ -411,12 +609,17 @@ def libdav1d() -> None:
         if os.system(f"git clone --branch {LIBDAV1D_VERSION} https://code.videolan.org/videolan/dav1d.git {source_directory}") != 0:
             raise ChildProcessError("git clone of libdav1d failed")
 
+    if FETCH_ONLY:
+        # the cross files don't depend on the build configuration, so they are made once for every matrix cell
+        gen_meson_files()
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libdav1d")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libdav1d")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libdav1d")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libdav1d")
 
         build_using_meson(abi, "libdav1d", build_directory, install_directory, source_directory, [
             "-Dlogging=false",
@@ -428,7 +631,6 @@ def libdav1d() -> None:
 
 
 def libuavs3d() -> None:
-    check_gawk()
     source_directory: str = os.path.join(CWD, "source", "libuavs3d")
 
     if not os.path.exists(source_directory):
@@ -436,15 +638,19 @@ def libuavs3d() -> None:
         if os.system(f"git clone --branch v{LIBUAVS3_VERSION} https://github.com/rbaucells/uavs3d.git {source_directory}") != 0:
             raise ChildProcessError("git clone of libuavs3d failed")
 
-    if os.system(os.path.join(source_directory, "version.sh")) != 0:
+    # writes its version header into the source tree, matrix cells share it and their fetch step already did this
+    if not SOURCES_PREPARED and os.system(os.path.join(source_directory, "version.sh")) != 0:
         raise ChildProcessError(f"libuavs3d version.sh in {source_directory} failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libuavs3d")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libuavs3d")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libuavs3d")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libuavs3d")
 
         build_using_cmake(abi, "libuavs3d", build_directory, install_directory, source_directory, [
             "-DCOMPILE_10BIT=1",
@@ -463,20 +669,21 @@ def libdavs2() -> None:
             raise ChildProcessError("git clone of libdavs2 failed")
 
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libdavs2")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libdavs2")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libdavs2")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libdavs2")
         configure_directory: str = f"{os.path.join(source_directory, "build", "linux")}/configure"
 
         configure_commands: list[str] = [
             configure_directory,
             "--enable-pic",
             "--enable-strip",
-            f"--host={abi.cross_prefix.rstrip('-')}",
-            f"--sysroot={os.path.join(toolchain_path, "sysroot")}",
             "--disable-cli",
             "--disable-asm",
             f"--prefix={install_directory}",
@@ -484,15 +691,21 @@ def libdavs2() -> None:
             f"--extra-ldflags={" ".join(abi.ld_flags)}"
         ]
 
+        if not abi.host:
+            configure_commands.extend([
+                f"--host={abi.cross_prefix.rstrip('-')}",
+                f"--sysroot={os.path.join(toolchain_path, "sysroot")}"
+            ])
+
         env = os.environ.copy()
 
         env.update({
-            "CC": abi.cc,
-            "CXX": abi.cxx,
-            "AS": os.path.join(toolchain_path, "bin", "llvm-as"),
-            "AR": os.path.join(toolchain_path, "bin", "llvm-ar"),
-            "STRIP": os.path.join(toolchain_path, "bin", "llvm-strip"),
-            "RANLIB": os.path.join(toolchain_path, "bin", "llvm-ranlib"),
+            "CC": abi.launched(abi.cc),
+            "CXX": abi.launched(abi.cxx),
+            "AS": abi.tool("llvm-as"),
+            "AR": abi.tool("llvm-ar"),
+            "STRIP": abi.tool("llvm-strip"),
+            "RANLIB": abi.tool("llvm-ranlib"),
             "PKGCONFIG": "pkg-config",
             "TOP_SRCPATH": source_directory,
             "BUILDPATH": build_directory
@@ -507,7 +720,7 @@ def libdavs2() -> None:
         subprocess.run(["make", f"-j{JOBS}"], check=True)
 
         print(f"Installing libdavs2 for {android_abi_name} to {install_directory}")
-        subprocess.run(["make", "install"], check=True)
+        staged_install(["make", "install"], build_directory, install_directory)
 
         # tell compiler and linker of ffmpeg where to look for this library's headers and libs, and tell pkg-config where to check for .pc files
         with abi.c_flags_lock, abi.ld_flags_lock, abi.pkg_config_paths_lock:
@@ -528,12 +741,15 @@ def libgme() -> None:
         if os.system(f"git clone --branch {LIBGME_VERSION} https://github.com/libgme/game-music-emu.git {source_directory}") != 0:
             raise ChildProcessError("git clone of libgme failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libgme")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libgme")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libgme")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libgme")
 
         build_using_cmake(abi, "libgme", build_directory, install_directory, source_directory, [
             "-DGME_BUILD_TESTING=OFF",
@@ -551,12 +767,15 @@ def libmfx() -> None:
         if os.system(f"git clone --branch {LIBMFX_VERSION} https://github.com/lu-zero/mfx_dispatch.git {source_directory}") != 0:
             raise ChildProcessError("git clone of libmfx failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libmfx")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libmfx")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libmfx")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libmfx")
 
         build_using_cmake(abi, "libmfx", build_directory, install_directory, source_directory, None)
 
@@ -571,12 +790,15 @@ def libkvazaar() -> None:
         if os.system(f"git clone --branch v{LIBKVAZAAR_VERSION} https://github.com/ultravideo/kvazaar.git {source_directory}") != 0:
             raise ChildProcessError("git clone of libkvazaar failed")
 
+    if FETCH_ONLY:
+        return
+
     # loop through abis to build
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libkvazaar")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libkvazaar")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libkvazaar")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libkvazaar")
 
         build_using_cmake(abi, "libkvazaar", build_directory, install_directory, source_directory, [
             "-DBUILD_TESTS=OFF",
@@ -608,11 +830,14 @@ def libmp3lame() -> None:
             raise ChildProcessError("download of newer gnu tools for libmp3lame failed")
 
 
+    if FETCH_ONLY:
+        return
+
     for abi in ABIS:
         android_abi_name = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", android_abi_name, "libmp3lame")
-        install_directory: str = os.path.join(CWD, "install", android_abi_name, "libmp3lame")
+        build_directory: str = os.path.join(BUILD_ROOT, android_abi_name, "libmp3lame")
+        install_directory: str = os.path.join(INSTALL_ROOT, android_abi_name, "libmp3lame")
         configure_directory: str = f"{os.path.join(source_directory)}/configure"
 
         configure_commands: list[str] = [
@@ -620,13 +845,15 @@ def libmp3lame() -> None:
             f"--prefix={install_directory}",
             "--disable-gtktest",
             "--disable-frontend",
-            f"--host={abi.cross_prefix.rstrip("-")}",
             "--with-pic",
             "--disable-mp3x",
             "--disable-mp3rtp",
             "--disable-analyzer-hooks"
         ]
 
+        if not abi.host:
+            configure_commands.append(f"--host={abi.cross_prefix.rstrip("-")}")
+
         if STATIC_BUILD:
             configure_commands.extend([
                 "--enable-shared=no",
@@ -642,12 +869,12 @@ def libmp3lame() -> None:
 
         with abi.c_flags_lock, abi.ld_flags_lock:
             env.update({
-                "CC": abi.cc,
+                "CC": abi.launched(abi.cc),
                 "CFLAGS": " ".join(abi.c_flags),
                 "LDFLAGS": " ".join(abi.ld_flags),
-                "AR": os.path.join(toolchain_path, "bin", "llvm-ar"),
-                "STRIP": os.path.join(toolchain_path, "bin", "llvm-strip"),
-                "RANLIB": os.path.join(toolchain_path, "bin", "llvm-ranlib"),
+                "AR": abi.tool("llvm-ar"),
+                "STRIP": abi.tool("llvm-strip"),
+                "RANLIB": abi.tool("llvm-ranlib"),
                 "PKG_CONFIG": "pkg-config"
             })
 
@@ -658,13 +885,13 @@ def libmp3lame() -> None:
         os.chdir(build_directory)
 
         print(f"Configuring libmp3lame for {android_abi_name}")
-        subprocess.run(configure_commands, env=env, check=True)
+        run_autoconf_configure(abi, configure_commands, env, build_directory)
 
         print(f"Making libmp3lame for {android_abi_name} at {build_directory}")
         subprocess.run(["make", f"-j{JOBS}"], check=True)
 
         print(f"Installing libmp3lame for {android_abi_name} to {install_directory}")
-        subprocess.run(["make", "install"], check=True)
+        staged_install(["make", "install"], build_directory, install_directory)
 
         # tell compiler and linker of ffmpeg where to look for this library's headers and libs, and tell pkg-config where to check for .pc files
         with abi.c_flags_lock, abi.ld_flags_lock, abi.pkg_config_paths_lock:
@@ -688,27 +915,26 @@ def ffmpeg() -> None:
         if os.system(f"git clone --branch n{FFMPEG_VERSION} https://github.com/FFmpeg/FFmpeg.git {source_directory}") != 0:
             raise ChildProcessError("git clone of ffmpeg failed")
 
+    if FETCH_ONLY:
+        return
+
     # build for each abi
     for abi in ABIS:
         abi_name: str = abi.android_arch_abi_name()
 
-        build_directory: str = os.path.join(CWD, "build", abi_name, "ffmpeg")
-        install_directory: str = os.path.join(CWD, "install", abi_name, "ffmpeg")
+        build_directory: str = os.path.join(BUILD_ROOT, abi_name, "ffmpeg")
+        install_directory: str = os.path.join(INSTALL_ROOT, abi_name, "ffmpeg")
         configure_directory = f"{source_directory}/configure"
 
         configure_commands: list[str] = [
                                configure_directory,
-                               "--target-os=android",
-                               "--enable-cross-compile",
-                               "--nm=" + os.path.join(toolchain_path, "bin", "llvm-nm"),
-                               "--ar=" + os.path.join(toolchain_path, "bin", "llvm-ar"),
-                               "--sysroot=" + os.path.join(toolchain_path, "sysroot"),
-                               "--ranlib=" + os.path.join(toolchain_path, "bin", "llvm-ranlib"),
-                               "--strip=" + os.path.join(toolchain_path, "bin", "llvm-strip"),
+                               "--nm=" + abi.tool("llvm-nm"),
+                               "--ar=" + abi.tool("llvm-ar"),
+                               "--ranlib=" + abi.tool("llvm-ranlib"),
+                               "--strip=" + abi.tool("llvm-strip"),
                                "--pkg-config=pkg-config",
-                               "--extra-libs=-lc++",
                                f"--prefix={install_directory}"
-                           ] + abi.command() + library_flags
+                           ] + target_flags(abi) + abi.command() + library_flags
 
         if STATIC_BUILD:
             configure_commands.extend([
@@ -734,14 +960,21 @@ def ffmpeg() -> None:
 
         os.chdir(build_directory)
 
+        config_header: str = os.path.join(build_directory, "config.h")
+        previous_configuration = configuration_snapshot(config_header)
+
         print(f"Configuring ffmpeg for {abi_name}")
         subprocess.run(configure_commands, env=env, check=True)
 
+        # the configure line ffmpeg keeps in libavutil has the checkout's and the ndk's paths in it
+        if REPRODUCIBLE:
+            relocate_configuration(config_header, previous_configuration)
+
         print(f"Making ffmpeg for {abi_name} at {build_directory}")
         subprocess.run(["make", f"-j{JOBS}"], check=True)
 
         print(f"Installing ffmpeg for {abi_name} to {install_directory}")
-        subprocess.run(["make", "install"], check=True)
+        staged_install(["make", "install"], build_directory, install_directory)
 
         print(f"Finished Configuring, Making, Installing ffmpeg for {abi_name}")
 
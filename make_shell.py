@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import os
+import re
+import subprocess
+import sys
+import time
+
+# make runs every recipe line through this when time tracing (SHELL= in MAKEFLAGS), the lines that write a file with -o are
+# logged in .ninja_log's format to $MAKE_TIME_LOG. it can't import constants, its arguments are make's and not the script's
+
+OUTPUT = re.compile(r"\s-o\s*(\S+)")
+
+# cmake's makefiles compile with "cd <directory> && <compiler> ... -o <relative path>"
+DIRECTORY = re.compile(r"^\s*cd\s+(\S+)\s*&&")
+
+
+def main() -> int:
+    start = time.time()
+    status = subprocess.call(["/bin/sh"] + sys.argv[1:])
+    end = time.time()
+
+    log_path = os.environ.get("MAKE_TIME_LOG")
+    command = sys.argv[-1] if len(sys.argv) > 1 else ""
+    output = OUTPUT.search(command)
+
+    if log_path and output is not None and status == 0:
+        directory = DIRECTORY.match(command)
+        path = os.path.normpath(os.path.join(directory.group(1) if directory is not None else os.getcwd(), output.group(1).strip("'\"")))
+
+        # one short line per append, so parallel recipes don't interleave
+        with open(log_path, "a") as log:
+            log.write(f"{int(start * 1000)}\t{int(end * 1000)}\t0\t{path}\t0\n")
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
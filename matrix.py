@@ -0,0 +1,88 @@
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import *
+
+
+class MatrixCell:
+    def __init__(self, static_build: bool, api: str, external_lib_build_type: str):
+        self.static_build = static_build
+        self.api = api
+        self.external_lib_build_type = external_lib_build_type
+
+    # static-api28-release
+    def namespace(self) -> str:
+        return f"{"static" if self.static_build else "shared"}-api{self.api}-{self.external_lib_build_type.lower()}"
+
+    def command(self, jobs: int) -> list[str]:
+        return child_command(
+            static_build="true" if self.static_build else "false",
+            android_api=self.api,
+            external_lib_build_type=self.external_lib_build_type,
+            build_namespace=self.namespace(),
+            sources_prepared="true",
+            jobs=str(jobs),
+            # each cell can still send its library builds to the workers
+            workers=",".join(WORKERS)
+        )
+
+
+def matrix_cells() -> list[MatrixCell]:
+    # dimensions that weren't given keep the single value from the normal options
+    static_builds: list[bool] = MATRIX_STATIC_BUILD or [STATIC_BUILD]
+    apis: list[str] = MATRIX_API or [API]
+    build_types: list[str] = MATRIX_EXTERNAL_LIB_BUILD_TYPE or [EXTERNAL_LIB_BUILD_TYPE]
+
+    return [MatrixCell(static_build, api, build_type) for static_build, api, build_type in itertools.product(static_builds, apis, build_types)]
+
+
+def fetch_sources() -> None:
+    # sources are shared by every cell, get them once so the cells don't race each other cloning
+    print("Fetching sources for all matrix cells")
+    subprocess.run(child_command(fetch_only="true"), check=True)
+
+
+def run_cell(cell: MatrixCell, jobs: int) -> int:
+    namespace: str = cell.namespace()
+    log_path: str = os.path.join(CWD, "build", namespace, "build.log")
+
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    print(f"Building matrix cell {namespace} with {jobs} jobs, log at {log_path}")
+
+    with open(log_path, "w") as log:
+        # cells can't answer licence prompts, they run unattended next to each other
+        result = subprocess.run(cell.command(jobs), stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+
+    if result.returncode == 0:
+        print(f"Matrix cell {namespace} finished, installed to {os.path.join(CWD, "install", namespace)}")
+    else:
+        print(f"Matrix cell {namespace} failed with exit code {result.returncode}, see {log_path}")
+
+    return result.returncode
+
+
+def run_matrix() -> None:
+    cells: list[MatrixCell] = matrix_cells()
+
+    if not AUTO_ACCEPT_LICENCE:
+        print("Matrix builds can't ask for licence upgrades, pass --auto_accept_licence=y")
+        exit(1)
+
+    # every cell runs at the same time, split the job budget between them instead of giving each one all of it
+    jobs: int = max(1, int(JOBS) // len(cells))
+
+    print(f"Building {len(cells)} matrix cells: {", ".join(cell.namespace() for cell in cells)}")
+
+    fetch_sources()
+
+    with ThreadPoolExecutor(max_workers=len(cells)) as executor:
+        return_codes: list[int] = list(executor.map(lambda cell: run_cell(cell, jobs), cells))
+
+    failed: list[str] = [cell.namespace() for cell, return_code in zip(cells, return_codes) if return_code != 0]
+
+    if failed:
+        raise ChildProcessError(f"Matrix cells failed: {", ".join(failed)}")
+
+    print("Success, all matrix cells were built/installed")
@@ -0,0 +1,297 @@
+import fcntl
+import hashlib
+import shutil
+import struct
+import subprocess
+
+from constants import *
+from elf import *
+
+# the two builds the check compares, each in its own directory so they don't share a path
+CHECK_ROOT: str = os.path.join(CWD, "reproducible")
+CHECK_RUNS: list[str] = ["a", "b"]
+
+# how many differing files and archive members to print
+SHOWN: int = 20
+
+# linux ioctl to make a copy on write clone of a file (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def copy_file(source: str, destination: str) -> None:
+    # a copy on write clone where the file system can make one (btrfs, xfs), a real copy otherwise, never a hardlink
+    try:
+        with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+
+        shutil.copystat(source, destination)
+        return
+    except OSError:
+        pass
+
+    shutil.copy2(source, destination)
+
+
+# ------------------------------ normalising installed files ------------------------------
+
+def ar_header(name: bytes, size: int, mode: int = 0o644) -> bytes:
+    # name, mtime, uid, gid, mode, size, every field space padded, the same on every machine
+    return name.ljust(16) + b"0".ljust(12) + b"0".ljust(6) + b"0".ljust(6) + f"{mode:o}".encode().ljust(8) + str(size).encode().ljust(10) + b"`\n"
+
+
+def padded(content: bytes) -> bytes:
+    return content + b"\n" if len(content) & 1 else content
+
+
+def normalize_archive(path: str) -> bool:
+    with open(path, "rb") as archive_file:
+        data = archive_file.read()
+
+    if data[:8] != AR_MAGIC:
+        return False
+
+    # stable, so objects with the same name keep their order
+    members: list[ArchiveMember] = sorted(archive_members(data), key=lambda member: member.name)
+
+    # llvm bitcode or anything else the index can't be made for is left the way the build system made it
+    if not all(data[member.offset:member.offset + 4] == ELF_MAGIC for member in members):
+        return False
+
+    contents: list[bytes] = [data[member.offset:member.offset + member.size] for member in members]
+
+    # gnu long names, "name/" in the header when it fits, "/offset" into the // table otherwise
+    long_names = bytearray()
+    header_names: list[bytes] = []
+
+    for member in members:
+        name = member.name.encode()
+
+        if len(name) < 16 and b"/" not in name:
+            header_names.append(name + b"/")
+        else:
+            header_names.append(f"/{len(long_names)}".encode())
+            long_names += name + b"/\n"
+
+    # the symbol index the linker searches, what ranlib would write, every global definition of every member
+    symbols: list[list[bytes]] = []
+
+    for member, content in zip(members, contents):
+        symbols.append([symbol.name.encode() for symbol in ElfFile(content).symbols() if symbol.bind != STB_LOCAL and symbol.defined() and symbol.name])
+
+    names_size = sum(len(name) + 1 for member_symbols in symbols for name in member_symbols)
+    index_size = 4 + 4 * sum(len(member_symbols) for member_symbols in symbols) + names_size
+
+    position = 8 + 60 + len(padded(b"\0" * index_size))
+
+    if long_names:
+        position += 60 + len(padded(bytes(long_names)))
+
+    offsets: list[int] = []
+
+    for content in contents:
+        offsets.append(position)
+        position += 60 + len(padded(content))
+
+    # gnu's 32 bit index can't point past 4 GiB
+    if position > 0xffffffff:
+        return False
+
+    index = bytearray(struct.pack(">I", sum(len(member_symbols) for member_symbols in symbols)))
+
+    for offset, member_symbols in zip(offsets, symbols):
+        index += struct.pack(">I", offset) * len(member_symbols)
+
+    for member_symbols in symbols:
+        for name in member_symbols:
+            index += name + b"\0"
+
+    result = bytearray(AR_MAGIC)
+    result += ar_header(b"/", len(index), 0) + padded(bytes(index))
+
+    if long_names:
+        result += ar_header(b"//", len(long_names), 0) + padded(bytes(long_names))
+
+    for header_name, content in zip(header_names, contents):
+        result += ar_header(header_name, len(content)) + padded(content)
+
+    if result == data:
+        return False
+
+    # installed files can be hardlinks into the object store, never write into them
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temporary_path, "wb") as archive_file:
+        archive_file.write(result)
+
+    shutil.copymode(path, temporary_path)
+    os.replace(temporary_path, path)
+
+    return True
+
+
+def normalize_pkgconfig(path: str, install_path: str, install_directory: str) -> bool:
+    with open(path) as pc_file:
+        content = pc_file.read()
+
+    # ${pcfiledir} is where pkg-config found the file, so the prefix follows the install directory wherever it is
+    relative = os.path.relpath(install_directory, os.path.dirname(install_path))
+    result = content.replace(install_directory, "${pcfiledir}" if relative == "." else f"${{pcfiledir}}/{relative}")
+
+    if result == content:
+        return False
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temporary_path, "w") as pc_file:
+        pc_file.write(result)
+
+    shutil.copymode(path, temporary_path)
+    os.replace(temporary_path, path)
+
+    return True
+
+
+def normalize_tree(directory: str, install_directory: str) -> None:
+    # directory is either the install directory itself or the staging directory standing in for it
+    install_directory = os.path.abspath(install_directory)
+    changed: int = 0
+
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+
+            if name.endswith(".a"):
+                changed += normalize_archive(path)
+            elif name.endswith(".pc"):
+                changed += normalize_pkgconfig(path, os.path.join(install_directory, os.path.relpath(path, directory)), install_directory)
+
+    print(f"Normalized {changed} archives and pkg-config files for {install_directory}")
+
+
+def relocate_configuration(config_header: str, previous: tuple[str, int] | None) -> None:
+    # ffmpeg compiles its whole configure line into libavutil (avutil_configuration(), ffmpeg -buildconf)
+    with open(config_header) as header_file:
+        lines = header_file.readlines()
+
+    for index, line in enumerate(lines):
+        if line.startswith("#define FFMPEG_CONFIGURATION "):
+            for path, replacement in sorted(PREFIX_MAPS, key=lambda prefix_map: -len(prefix_map[0])):
+                line = line.replace(path, replacement)
+
+            lines[index] = line
+
+    content = "".join(lines)
+
+    with open(config_header, "w") as header_file:
+        header_file.write(content)
+
+    # configure rewrote the header because it differs from the relocated one, put the old mtime back when nothing really changed so make doesn't rebuild everything
+    if previous is not None and previous[0] == content:
+        os.utime(config_header, ns=(previous[1], previous[1]))
+
+
+def configuration_snapshot(config_header: str) -> tuple[str, int] | None:
+    if not os.path.exists(config_header):
+        return None
+
+    with open(config_header) as header_file:
+        return header_file.read(), os.stat(config_header).st_mtime_ns
+
+
+# ------------------------------ checking ------------------------------
+
+def check_command(**overrides: str) -> list[str]:
+    # both builds are plain single configuration builds, without anything that would make them differ
+    return child_command(reproducible="true", benchmark="false", **overrides)
+
+
+def tree_hashes(directory: str) -> dict[str, str]:
+    hashes: dict[str, str] = {}
+
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if os.path.islink(path):
+                hashes[os.path.relpath(path, directory)] = f"-> {os.readlink(path)}"
+            else:
+                with open(path, "rb") as file:
+                    hashes[os.path.relpath(path, directory)] = hashlib.file_digest(file, "sha256").hexdigest()
+
+    return hashes
+
+
+def archive_differences(first_path: str, second_path: str) -> list[str]:
+    contents: list[dict[str, bytes]] = []
+
+    for path in [first_path, second_path]:
+        with open(path, "rb") as archive_file:
+            data = archive_file.read()
+
+        contents.append({member.name: data[member.offset:member.offset + member.size] for member in archive_members(data)} if data[:8] == AR_MAGIC else {})
+
+    first, second = contents
+
+    return sorted(name for name in first.keys() | second.keys() if first.get(name) != second.get(name))
+
+
+def run_check_build(run: str) -> str:
+    directory = os.path.join(CHECK_ROOT, run)
+    log_path = os.path.join(directory, "build.log")
+
+    # a copy of the sources, so they sit inside each build's own directory like they would on another machine, never hardlinks since builds write into their source tree (version.sh, generated headers)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+
+    shutil.copytree(os.path.join(CWD, "source"), os.path.join(directory, "source"), symlinks=True, copy_function=copy_file)
+
+    print(f"Reproducibility check build {run} in {directory}, log at {log_path}")
+
+    with open(log_path, "w") as log:
+        result = subprocess.run(check_command(), cwd=directory, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+
+    if result.returncode != 0:
+        raise ChildProcessError(f"Reproducibility check build {run} failed with exit code {result.returncode}, see {log_path}")
+
+    return os.path.join(directory, "install", BUILD_NAMESPACE) if BUILD_NAMESPACE else os.path.join(directory, "install")
+
+
+def check_reproducible() -> None:
+    if not AUTO_ACCEPT_LICENCE:
+        print("Reproducibility check builds can't ask for licence upgrades, pass --auto_accept_licence=y")
+        exit(1)
+
+    # both builds use the same sources, fetch them here first
+    subprocess.run(check_command(fetch_only="true"), check=True)
+
+    install_directories: list[str] = [run_check_build(run) for run in CHECK_RUNS]
+    first, second = [tree_hashes(directory) for directory in install_directories]
+
+    only_first = sorted(first.keys() - second.keys())
+    only_second = sorted(second.keys() - first.keys())
+    different = sorted(path for path in first.keys() & second.keys() if first[path] != second[path])
+
+    if not only_first and not only_second and not different:
+        print(f"Reproducible, both builds installed the same {len(first)} files")
+        return
+
+    print(f"Not reproducible, {len(different)} files differ, {len(only_first) + len(only_second)} were only installed by one build")
+
+    for path in only_first[:SHOWN]:
+        print(f"    only in build {CHECK_RUNS[0]}: {path}")
+
+    for path in only_second[:SHOWN]:
+        print(f"    only in build {CHECK_RUNS[1]}: {path}")
+
+    for path in different[:SHOWN]:
+        members = archive_differences(*[os.path.join(directory, path) for directory in install_directories]) if path.endswith(".a") else []
+        print(f"    differs: {path}{f" (members {", ".join(members[:SHOWN])})" if members else ""}")
+
+    raise RuntimeError("Build is not reproducible")
+
+
+if __name__ == "__main__":
+    check_reproducible()
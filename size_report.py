@@ -0,0 +1,222 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import *
+from elf import *
+from verify import installed_artifacts, library_of
+
+SIZE_REPORT_PATH: str = os.path.join(BUILD_ROOT, "size_report.json")
+PREVIOUS_SIZE_REPORT_PATH: str = os.path.join(BUILD_ROOT, "size_report.previous.json")
+
+GROUPS: list[str] = ["text", "rodata", "data", "bss"]
+
+# how many objects and symbols to print, the json report has all of them
+TOP: int = 15
+
+
+def section_group(section: Section) -> str | None:
+    if not section.flags & SHF_ALLOC:
+        return None
+
+    if section.type == SHT_NOBITS:
+        return "bss"
+
+    if section.flags & SHF_EXECINSTR:
+        return "text"
+
+    if section.name.startswith(".rodata"):
+        return "rodata"
+
+    if section.flags & SHF_WRITE:
+        return "data"
+
+    return None
+
+
+def measure_elf(elf: ElfFile) -> dict:
+    sections: dict[str, int] = dict.fromkeys(GROUPS, 0)
+    groups: list[str | None] = [section_group(section) for section in elf.sections]
+
+    for section, group in zip(elf.sections, groups):
+        if group is not None:
+            sections[group] += section.size
+
+    symbols: dict[str, list] = {}
+
+    # a stripped shared library only has its exported symbols left
+    for symbol in elf.symbols() or elf.symbols(dynamic=True):
+        if symbol.size == 0 or symbol.type not in (STT_FUNC, STT_OBJECT) or not symbol.defined() or symbol.shndx >= len(groups):
+            continue
+
+        group = groups[symbol.shndx]
+
+        if group is None:
+            continue
+
+        entry = symbols.setdefault(symbol.name, [group, 0])
+        entry[1] += symbol.size
+
+    return {"sections": sections, "symbols": symbols}
+
+
+def measure_file(path: str) -> dict:
+    data = open_mapped(path)
+    objects: dict[str, dict] = {}
+
+    if data is None:
+        return objects
+
+    try:
+        for elf in elf_files(path, data):
+            # archive members are named path(object.o), a shared library is one linked object
+            name = elf.name[len(path) + 1:-1] if elf.name != path else "(linked)"
+            measurement = measure_elf(elf)
+
+            # the same object name can appear twice in an archive
+            if name in objects:
+                name = f"{name}#{len(objects)}"
+
+            objects[name] = measurement
+    finally:
+        data.close()
+
+    return objects
+
+
+def total(sections: dict[str, int]) -> int:
+    # bss takes memory but no space in the apk
+    return sections["text"] + sections["rodata"] + sections["data"]
+
+
+def summed(measurements: list[dict]) -> dict[str, int]:
+    result = dict.fromkeys(GROUPS, 0)
+
+    for measurement in measurements:
+        for group in GROUPS:
+            result[group] += measurement["sections"][group]
+
+    return result
+
+
+def build_report() -> dict:
+    report: dict = {}
+
+    with ProcessPoolExecutor() as executor:
+        for abi in ABIS:
+            artifacts = installed_artifacts(abi)
+            files: dict[str, dict] = {}
+
+            for path, objects in zip(artifacts, executor.map(measure_file, artifacts, chunksize=1)):
+                files[os.path.relpath(path, INSTALL_ROOT)] = {
+                    "library": library_of(path),
+                    "sections": summed(list(objects.values())),
+                    "objects": objects
+                }
+
+            report[abi.android_arch_abi_name()] = files
+
+    return report
+
+
+def component_of(path: str, file: dict) -> str:
+    # ffmpeg installs one archive or shared library per component, each gets its own row
+    if file["library"] == "ffmpeg":
+        return f"ffmpeg/{os.path.basename(path).split(".")[0]}"
+
+    return file["library"]
+
+
+def signed(value: int) -> str:
+    return f"{value:+,}" if value else ""
+
+
+def print_report(report: dict, previous: dict) -> None:
+    for abi_name, files in report.items():
+        previous_files: dict = previous.get(abi_name, {})
+
+        print(f"Size report for {abi_name} (text + rodata + data, change since the previous report)")
+
+        libraries: dict[str, list[dict]] = {}
+        previous_libraries: dict[str, list[dict]] = {}
+
+        for path, file in files.items():
+            libraries.setdefault(component_of(path, file), []).append(file)
+
+        for path, file in previous_files.items():
+            previous_libraries.setdefault(component_of(path, file), []).append(file)
+
+        # libraries that aren't built anymore are listed with nothing left
+        for library in sorted(libraries.keys() | previous_libraries.keys(), key=lambda name: -total(summed(libraries.get(name, [])))):
+            sections = summed(libraries.get(library, []))
+            previous_total = total(summed(previous_libraries[library])) if library in previous_libraries else 0
+            print(f"    {library:<24}{total(sections):>14,}  text {sections["text"]:>12,}  rodata {sections["rodata"]:>11,}  data {sections["data"]:>10,}  {signed(total(sections) - previous_total)}")
+
+        objects: list[tuple[int, str, int]] = []
+        symbols: list[tuple[int, str]] = []
+
+        for path, file in files.items():
+            previous_objects: dict = previous_files.get(path, {}).get("objects", {})
+
+            for name, measurement in file["objects"].items():
+                size = total(measurement["sections"])
+                previous_size = total(previous_objects[name]["sections"]) if name in previous_objects else 0
+                objects.append((size, f"{file["library"]}/{os.path.basename(path)}/{name}", size - previous_size))
+
+                for symbol, (group, symbol_size) in measurement["symbols"].items():
+                    if group != "bss":
+                        symbols.append((symbol_size, f"{file["library"]}/{name}/{symbol} ({group})"))
+
+            # objects that are gone since the previous report, e.g. a codec that was disabled
+            for name, measurement in previous_objects.items():
+                if name not in file["objects"]:
+                    objects.append((0, f"{file["library"]}/{os.path.basename(path)}/{name}", -total(measurement["sections"])))
+
+        # and whole files that aren't installed anymore
+        for path, file in previous_files.items():
+            if path not in files:
+                for name, measurement in file["objects"].items():
+                    objects.append((0, f"{file["library"]}/{os.path.basename(path)}/{name}", -total(measurement["sections"])))
+
+        print("  Largest objects:")
+
+        for size, name, change in sorted((item for item in objects if item[0]), reverse=True)[:TOP]:
+            print(f"    {size:>12,}  {name}  {signed(change)}")
+
+        if previous_files:
+            print("  Largest changes:")
+
+            for size, name, change in sorted(objects, key=lambda item: -abs(item[2]))[:TOP]:
+                if change:
+                    print(f"    {change:>+12,}  {name}")
+
+        print("  Largest symbols:")
+
+        for size, name in sorted(symbols, reverse=True)[:TOP]:
+            print(f"    {size:>12,}  {name}")
+
+
+def size_report() -> None:
+    start = time.monotonic()
+
+    report = build_report()
+    previous: dict = {}
+
+    if os.path.exists(SIZE_REPORT_PATH):
+        with open(SIZE_REPORT_PATH) as report_file:
+            previous = json.load(report_file)
+
+        os.replace(SIZE_REPORT_PATH, PREVIOUS_SIZE_REPORT_PATH)
+
+    os.makedirs(os.path.dirname(SIZE_REPORT_PATH), exist_ok=True)
+
+    with open(SIZE_REPORT_PATH, "w") as report_file:
+        json.dump(report, report_file)
+
+    print_report(report, previous)
+
+    print(f"Size report written to {SIZE_REPORT_PATH} in {time.monotonic() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    size_report()
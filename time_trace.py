@@ -0,0 +1,216 @@
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import *
+
+MAKE_SHELL: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "make_shell.py")
+
+# every make step of every library, lines have the build directory in their path so they can be told apart
+MAKE_TIME_LOG: str = os.path.join(BUILD_ROOT, "time_trace", "make.log")
+
+TIME_TRACE_REPORT_PATH: str = os.path.join(BUILD_ROOT, "time_trace", "report.json")
+
+# clang starts every trace file with this
+TRACE_MAGIC = b"{\"traceEvents\":"
+
+TEMPLATE_EVENTS: set[str] = {"InstantiateClass", "InstantiateFunction"}
+
+# how many of each to print, the json report has all of them
+TOP: int = 10
+
+
+def is_trace(path: str) -> bool:
+    with open(path, "rb") as file:
+        return file.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+
+def parse_trace(path: str) -> dict:
+    with open(path) as trace_file:
+        events: list[dict] = json.load(trace_file)["traceEvents"]
+
+    total: int = 0
+    frontend: int = 0
+    backend: int = 0
+    headers: dict[str, int] = {}
+    templates: dict[str, int] = {}
+
+    # durations are in microseconds, "Source" is the inclusive time of parsing one #include
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+
+        name: str = event.get("name", "")
+        duration: int = event.get("dur", 0)
+
+        match name:
+            case "ExecuteCompiler":
+                total = max(total, duration)
+            case "Frontend":
+                frontend += duration
+            case "Backend":
+                backend += duration
+            case "Source":
+                detail = event["args"]["detail"]
+                headers[detail] = headers.get(detail, 0) + duration
+            case _ if name in TEMPLATE_EVENTS:
+                detail = event["args"]["detail"]
+                templates[detail] = templates.get(detail, 0) + duration
+
+    return {
+        "total": total or frontend + backend,
+        "frontend": frontend,
+        "backend": backend,
+        "headers": headers,
+        "templates": templates
+    }
+
+
+def parse_ninja_log(path: str) -> dict[str, int]:
+    steps: dict[str, int] = {}
+
+    with open(path) as log:
+        for line in log:
+            if line.startswith("#"):
+                continue
+
+            fields = line.rstrip("\n").split("\t")
+
+            # start, end, mtime, output, hash, the last entry for an output is from its latest build
+            if len(fields) >= 4:
+                steps[fields[3]] = int(fields[1]) - int(fields[0])
+
+    return steps
+
+
+def make_steps() -> dict[str, dict[str, int]]:
+    # build/<abi>/<lib> -> output relative to it -> milliseconds
+    steps: dict[str, dict[str, int]] = {}
+
+    if not os.path.exists(MAKE_TIME_LOG):
+        return steps
+
+    for path, milliseconds in parse_ninja_log(MAKE_TIME_LOG).items():
+        relative = os.path.relpath(path, BUILD_ROOT).split(os.sep)
+
+        if len(relative) > 2 and not relative[0].startswith(".."):
+            steps.setdefault(os.path.join(relative[0], relative[1]), {})[os.path.join(*relative[2:])] = milliseconds
+
+    return steps
+
+
+def trace_files(build_directory: str) -> list[str]:
+    return sorted(path for path in glob.glob(os.path.join(build_directory, "**", "*.json"), recursive=True) if is_trace(path))
+
+
+def summarise(build_directory: str, traces: dict[str, dict], steps: dict[str, int]) -> dict:
+    headers: dict[str, list[int]] = {}
+    templates: dict[str, list[int]] = {}
+
+    for trace in traces.values():
+        for kind, totals in [("headers", headers), ("templates", templates)]:
+            for name, duration in trace[kind].items():
+                entry = totals.setdefault(name, [0, 0])
+                entry[0] += duration
+                entry[1] += 1
+
+    files = sorted(([os.path.relpath(path, build_directory)[:-len(".json")], trace["total"], trace["frontend"], trace["backend"]] for path, trace in traces.items()), key=lambda file: -file[1])
+
+    # [name, total microseconds, translation units]
+    return {
+        "compile_time": sum(trace["total"] for trace in traces.values()),
+        "frontend": sum(trace["frontend"] for trace in traces.values()),
+        "backend": sum(trace["backend"] for trace in traces.values()),
+        "files": files,
+        "headers": sorted(([name] + entry for name, entry in headers.items()), key=lambda header: -header[1]),
+        "templates": sorted(([name] + entry for name, entry in templates.items()), key=lambda template: -template[1]),
+        "steps": sorted(([name, milliseconds] for name, milliseconds in steps.items()), key=lambda step: -step[1])
+    }
+
+
+def build_report() -> dict:
+    report: dict = {}
+    logged_make_steps = make_steps()
+
+    with ProcessPoolExecutor() as executor:
+        for abi in ABIS:
+            abi_name = abi.android_arch_abi_name()
+
+            for build_directory in sorted(glob.glob(os.path.join(BUILD_ROOT, abi_name, "*"))):
+                if not os.path.isdir(build_directory):
+                    continue
+
+                paths = trace_files(build_directory)
+                traces: dict[str, dict] = dict(zip(paths, executor.map(parse_trace, paths, chunksize=16)))
+
+                key = os.path.relpath(build_directory, BUILD_ROOT)
+
+                # meson and cmake's ninja generator keep their own log, make steps come from make_shell.py
+                steps: dict[str, int] = dict(logged_make_steps.get(key, {}))
+                ninja_log = os.path.join(build_directory, ".ninja_log")
+
+                if os.path.exists(ninja_log):
+                    steps.update(parse_ninja_log(ninja_log))
+
+                if traces or steps:
+                    report[key] = summarise(build_directory, traces, steps)
+
+    return report
+
+
+def shortened(path: str) -> str:
+    # headers are absolute paths, most of them inside the checkout or the ndk
+    for prefix, replacement in [(CWD, "."), (toolchain_path, "<ndk>")]:
+        if path.startswith(prefix + os.sep):
+            return replacement + path[len(prefix):]
+
+    return path
+
+
+def print_report(report: dict) -> None:
+    for key, summary in sorted(report.items(), key=lambda item: -item[1]["compile_time"]):
+        print(f"Time trace for {key}: {len(summary["files"])} translation units, {summary["compile_time"] / 1e6:.1f}s compiling (frontend {summary["frontend"] / 1e6:.1f}s, backend {summary["backend"] / 1e6:.1f}s)")
+
+        if summary["files"]:
+            print("  Slowest files:")
+
+            for name, total, frontend, backend in summary["files"][:TOP]:
+                print(f"    {total / 1e6:>9.2f}s  {name}  (frontend {frontend / 1e6:.2f}s, backend {backend / 1e6:.2f}s)")
+
+        if summary["headers"]:
+            print("  Slowest headers (parse time including their own includes, translation units including them):")
+
+            for name, total, count in summary["headers"][:TOP]:
+                print(f"    {total / 1e6:>9.2f}s  {count:>5}  {shortened(name)}")
+
+        if summary["templates"]:
+            print("  Slowest template instantiations:")
+
+            for name, total, count in summary["templates"][:TOP]:
+                print(f"    {total / 1e6:>9.2f}s  {count:>5}  {name}")
+
+        if summary["steps"]:
+            print("  Slowest build steps (ninja and make, including assembly and linking):")
+
+            for name, milliseconds in summary["steps"][:TOP]:
+                print(f"    {milliseconds / 1e3:>9.2f}s  {name}")
+
+
+def time_trace_report() -> None:
+    start = time.monotonic()
+
+    report = build_report()
+
+    os.makedirs(os.path.dirname(TIME_TRACE_REPORT_PATH), exist_ok=True)
+
+    with open(TIME_TRACE_REPORT_PATH, "w") as report_file:
+        json.dump(report, report_file)
+
+    print_report(report)
+
+    print(f"Time trace report written to {TIME_TRACE_REPORT_PATH} in {time.monotonic() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    time_trace_report()
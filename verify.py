@@ -0,0 +1,254 @@
+import glob
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import *
+from dependencies import toolchain_fingerprint
+from elf import *
+
+# elf machine and class each abi has to be built for
+ABI_MACHINES: dict[str, tuple[int, bool]] = {
+    "arm": (EM_ARM, False),
+    "aarch64": (EM_AARCH64, True),
+    "x86": (EM_386, False),
+    "x86_64": (EM_X86_64, True)
+}
+
+# directory of each abi's libunwind.a and friends in clang's resource directory
+RESOURCE_ARCHES: dict[str, str] = {
+    "arm": "arm",
+    "aarch64": "aarch64",
+    "x86": "i386",
+    "x86_64": "x86_64"
+}
+
+# what the linker flags in ABI.ld_flags ask for
+PAGE_SIZE: int = 16384
+
+# made up by the linker, never defined by any library
+LINKER_SYMBOLS: set[str] = {"_GLOBAL_OFFSET_TABLE_", "_DYNAMIC", "__dso_handle", "__ehdr_start", "__executable_start", "__bss_start", "_edata", "_end", "_etext"}
+
+
+class FileReport:
+    def __init__(self, path: str):
+        self.path = path
+        self.issues: list[str] = []
+
+        # strong and weak definitions, and references that have to be resolved by something else
+        self.defined: set[str] = set()
+        self.undefined: set[str] = set()
+
+        # strong definitions in the objects of a static archive
+        self.strong: set[str] = set()
+
+
+def inspect_file(path: str, machine: int, is_64: bool) -> FileReport:
+    report = FileReport(path)
+    data = open_mapped(path)
+
+    if data is None:
+        report.issues.append("empty file")
+        return report
+
+    try:
+        files = elf_files(path, data)
+
+        if not files and data[:8] == AR_MAGIC:
+            report.issues.append("archive without any elf objects")
+
+        for elf in files:
+            if elf.machine != machine or elf.is_64 != is_64:
+                report.issues.append(f"{elf.name} is built for machine {elf.machine} ({"64" if elf.is_64 else "32"} bit), expected {machine} ({"64" if is_64 else "32"} bit)")
+                continue
+
+            if elf.type == ET_DYN:
+                for header in elf.program_headers():
+                    if header.type == PT_LOAD and header.align < PAGE_SIZE:
+                        report.issues.append(f"{elf.name} has a PT_LOAD segment aligned to {header.align} bytes, expected at least {PAGE_SIZE}")
+                        break
+
+                if elf.has_text_relocations():
+                    report.issues.append(f"{elf.name} has text relocations")
+
+                symbols = elf.symbols(dynamic=True)
+            else:
+                relocations = elf.absolute_code_relocations()
+
+                if relocations:
+                    report.issues.append(f"{elf.name} has {relocations} absolute relocations in code, not position independent")
+
+                symbols = elf.symbols()
+
+            for symbol in symbols:
+                if symbol.bind == STB_LOCAL or not symbol.name:
+                    continue
+
+                if symbol.defined():
+                    report.defined.add(symbol.name)
+
+                    # the same symbol in two objects of one archive is fine, only one of them gets linked
+                    if elf.type == ET_REL and symbol.bind == STB_GLOBAL and symbol.shndx != SHN_COMMON:
+                        report.strong.add(symbol.name)
+                elif symbol.bind != STB_WEAK:
+                    report.undefined.add(symbol.name)
+    finally:
+        data.close()
+
+    return report
+
+
+def system_libraries(abi: ABI) -> list[str]:
+    # the host target links against whatever the machine has, there's no sysroot to check against
+    if abi.host:
+        return []
+
+    triple = abi.cross_prefix.rstrip("-")
+    sysroot_lib = os.path.join(toolchain_path, "sysroot", "usr", "lib", triple)
+
+    # libc, libm, liblog... for the api level, the c++ runtime, compiler-rt's builtins, and libunwind (_Unwind_Resume, __aeabi_unwind_cpp_pr*) from the resource directory
+    return sorted(
+        glob.glob(os.path.join(sysroot_lib, API, "*.so")) +
+        glob.glob(os.path.join(sysroot_lib, "*.a")) +
+        glob.glob(os.path.join(toolchain_path, "lib", "clang", "*", "lib", "linux", f"libclang_rt.builtins-{abi.arch if abi.arch != "x86" else "i686"}-android.a")) +
+        glob.glob(os.path.join(toolchain_path, "lib", "clang", "*", "lib", "linux", RESOURCE_ARCHES[abi.arch], "*.a"))
+    )
+
+
+def system_symbols(abi: ABI, executor: ProcessPoolExecutor) -> set[str] | None:
+    libraries = system_libraries(abi)
+
+    if not libraries:
+        return None
+
+    # the sysroot only changes with the toolchain, so its symbols are kept with the toolchain fingerprint and which of its libraries were read
+    libraries_hash = hashlib.sha256("\n".join(libraries).encode()).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_ROOT, "verify", f"{abi.android_arch_abi_name()}-api{API}-{toolchain_fingerprint(abi)}-{libraries_hash}.json")
+
+    if os.path.exists(cache_path):
+        with open(cache_path) as cache_file:
+            return set(json.load(cache_file))
+
+    machine, is_64 = ABI_MACHINES[abi.arch]
+    symbols: set[str] = set()
+
+    for report in executor.map(inspect_file, libraries, [machine] * len(libraries), [is_64] * len(libraries)):
+        symbols |= report.defined
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    with open(cache_path, "w") as cache_file:
+        json.dump(sorted(symbols), cache_file)
+
+    return symbols
+
+
+def installed_artifacts(abi: ABI) -> list[str]:
+    result: list[str] = []
+
+    for lib_directory in sorted(glob.glob(os.path.join(INSTALL_ROOT, abi.android_arch_abi_name(), "*", "lib"))):
+        for name in sorted(os.listdir(lib_directory)):
+            path = os.path.join(lib_directory, name)
+
+            # libfoo.so -> libfoo.so.1 symlinks point at files that are checked anyway
+            if os.path.isfile(path) and not os.path.islink(path) and (name.endswith(".a") or ".so" in name):
+                result.append(path)
+
+    return result
+
+
+def library_of(path: str) -> str:
+    # install/<abi>/<lib>/lib/<file>
+    return os.path.basename(os.path.dirname(os.path.dirname(path)))
+
+
+def verify_abi(abi: ABI, executor: ProcessPoolExecutor) -> tuple[list[str], list[str]]:
+    abi_name = abi.android_arch_abi_name()
+    machine, is_64 = ABI_MACHINES[abi.arch]
+    artifacts = installed_artifacts(abi)
+
+    issues: list[str] = []
+
+    # only printed, the system libraries may not be all a real link pulls in
+    warnings: list[str] = []
+
+    if not artifacts:
+        return [f"nothing installed for {abi_name} in {os.path.join(INSTALL_ROOT, abi_name)}"], warnings
+
+    shared = [path for path in artifacts if not path.endswith(".a")]
+    ffmpeg_shared = [path for path in shared if library_of(path) == "ffmpeg"]
+
+    if STATIC_BUILD and shared:
+        issues.extend(f"{path} is a shared library but STATIC_BUILD is on" for path in shared)
+
+    if not STATIC_BUILD and os.path.isdir(os.path.join(INSTALL_ROOT, abi_name, "ffmpeg")) and not ffmpeg_shared:
+        issues.append(f"no ffmpeg shared libraries for {abi_name} but STATIC_BUILD is off")
+
+    reports: list[FileReport] = list(executor.map(inspect_file, artifacts, [machine] * len(artifacts), [is_64] * len(artifacts)))
+
+    for report in reports:
+        issues.extend(report.issues)
+
+    # strong definitions of the same symbol in two different libraries collide when ffmpeg links all of them
+    definitions: dict[str, list[str]] = {}
+
+    for report in reports:
+        for name in report.strong:
+            definitions.setdefault(name, []).append(report.path)
+
+    for name, paths in sorted(definitions.items()):
+        if len({library_of(path) for path in paths}) > 1:
+            issues.append(f"{name} is defined in more than one library: {", ".join(paths)}")
+
+    system = system_symbols(abi, executor)
+
+    if system is None:
+        print(f"No sysroot libraries for {abi_name}, not checking undefined symbols")
+        return issues, warnings
+
+    defined: set[str] = set(system)
+
+    for report in reports:
+        defined |= report.defined
+
+    for report in reports:
+        unresolved = sorted(name for name in report.undefined - defined - LINKER_SYMBOLS if not name.startswith(("__start_", "__stop_")))
+
+        if unresolved:
+            shown = ", ".join(unresolved[:10])
+            warnings.append(f"{report.path} references {len(unresolved)} symbols nothing defines: {shown}{", ..." if len(unresolved) > 10 else ""}")
+
+    return issues, warnings
+
+
+def verify() -> None:
+    start = time.monotonic()
+    issues: list[str] = []
+    warnings: list[str] = []
+
+    with ProcessPoolExecutor() as executor:
+        for abi in ABIS:
+            abi_issues, abi_warnings = verify_abi(abi, executor)
+            issues.extend(abi_issues)
+            warnings.extend(abi_warnings)
+
+    if warnings:
+        print("Verification warnings for the installed libraries:")
+
+        for warning in warnings:
+            print(f"    {warning}")
+
+    if issues:
+        print(f"Verification found {len(issues)} problems with the installed libraries:")
+
+        for issue in issues:
+            print(f"    {issue}")
+
+        raise RuntimeError("Installed libraries failed verification")
+
+    print(f"Verified installed libraries for all enabled abis in {time.monotonic() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    verify()
@@ -0,0 +1,267 @@
+import ctypes
+import ctypes.util
+import glob
+import os
+import select
+import struct
+import subprocess
+import sys
+import time
+
+from constants import *
+from dedup import install_tree, prune_objects, staged_install
+
+# how each library is built, so a changed library can be rebuilt in its existing build directory without configuring again
+LIBRARY_BUILD_SYSTEMS: dict[str, str] = {
+    "libaom": "cmake",
+    "amf": "headers",
+    "avisynth": "cmake",
+    "chromaprint": "cmake",
+    "libcodec2": "cmake",
+    "libdav1d": "meson",
+    "libuavs3d": "cmake",
+    "libdavs2": "make",
+    "libgme": "cmake",
+    "libmfx": "cmake",
+    "libkvazaar": "cmake",
+    "libmp3lame": "make",
+    "ffmpeg": "make"
+}
+
+# ffmpeg's programs, with and without their symbols
+LINKED_PROGRAMS: list[str] = ["ffmpeg", "ffmpeg_g", "ffprobe", "ffprobe_g"]
+
+# files of this script, a change to any of them means the whole recipe has to be rerun
+RECIPE_FILES: list[str] = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+
+# seconds to wait for more changes before rebuilding, editors usually write a file in several steps
+DEBOUNCE: float = 0.5
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def ignored(path: str) -> bool:
+    name = os.path.basename(path)
+
+    # version control metadata and editor temporary files
+    if f"{os.sep}.git" in path or name == ".git":
+        return True
+
+    return name.endswith((".swp", ".swx", "~", ".tmp")) or name.startswith(".#") or name == "4913"
+
+
+def watched_libraries() -> list[str]:
+    return [lib for lib in EXTERNAL_LIBS + ["ffmpeg"] if os.path.isdir(os.path.join(CWD, "source", lib))]
+
+
+def inotify_changes(directories: list[str], files: list[str]):
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+    fd: int = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    watches: dict[int, str] = {}
+
+    def add_watch(path: str) -> None:
+        wd = libc.inotify_add_watch(fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+        watches[wd] = path
+
+    def add_tree(root: str) -> None:
+        for directory, sub_directories, _ in os.walk(root):
+            sub_directories[:] = [sub_directory for sub_directory in sub_directories if not ignored(os.path.join(directory, sub_directory))]
+            add_watch(directory)
+
+    for directory in directories:
+        add_tree(directory)
+
+    # watch the directories holding the recipe files, editors replace files instead of writing them in place
+    for directory in {os.path.dirname(file) for file in files}:
+        add_watch(directory)
+
+    try:
+        while True:
+            changed: set[str] = set()
+            timeout: float | None = None
+
+            # block until the first change, then keep collecting until nothing changed for DEBOUNCE seconds
+            while select.select([fd], [], [], timeout)[0]:
+                buffer = os.read(fd, 64 * 1024)
+                offset = 0
+
+                while offset < len(buffer):
+                    wd, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                    name = buffer[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                    offset += INOTIFY_EVENT.size + length
+
+                    if mask & IN_Q_OVERFLOW:
+                        # events were dropped, assume everything changed
+                        changed.update(directories)
+                        continue
+
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+
+                    if wd not in watches:
+                        continue
+
+                    path = os.path.join(watches[wd], os.fsdecode(name))
+
+                    if ignored(path):
+                        continue
+
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        add_tree(path)
+
+                    changed.add(path)
+
+                timeout = DEBOUNCE
+
+            yield changed
+    finally:
+        os.close(fd)
+
+
+def snapshot(directories: list[str], files: list[str]) -> dict[str, tuple[int, int]]:
+    result: dict[str, tuple[int, int]] = {}
+
+    paths = list(files)
+
+    for root in directories:
+        for directory, sub_directories, names in os.walk(root):
+            sub_directories[:] = [sub_directory for sub_directory in sub_directories if not ignored(os.path.join(directory, sub_directory))]
+            paths.extend(os.path.join(directory, name) for name in names)
+
+    for path in paths:
+        if ignored(path):
+            continue
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        result[path] = (stat.st_mtime_ns, stat.st_size)
+
+    return result
+
+
+def polling_changes(directories: list[str], files: list[str]):
+    previous = snapshot(directories, files)
+
+    while True:
+        time.sleep(DEBOUNCE)
+        current = snapshot(directories, files)
+
+        if current != previous:
+            yield {path for path in previous.keys() | current.keys() if previous.get(path) != current.get(path)}
+
+        previous = current
+
+
+def changes(directories: list[str], files: list[str]):
+    if sys.platform.startswith("linux"):
+        try:
+            yield from inotify_changes(directories, files)
+            return
+        except OSError as error:
+            # usually fs.inotify.max_user_watches is too low for the source trees
+            print(f"Could not use inotify ({error}), falling back to polling for changes")
+
+    yield from polling_changes(directories, files)
+
+
+def rebuild(lib: str, abi: ABI) -> None:
+    abi_name: str = abi.android_arch_abi_name()
+
+    build_directory: str = os.path.join(BUILD_ROOT, abi_name, lib)
+    install_directory: str = os.path.join(INSTALL_ROOT, abi_name, lib)
+
+    print(f"Rebuilding {lib} for {abi_name} at {build_directory}")
+
+    match LIBRARY_BUILD_SYSTEMS[lib]:
+        case "cmake":
+            # cmake reconfigures on its own if a CMakeLists.txt changed
+            subprocess.run(["cmake", "--build", build_directory, f"-j{JOBS}"], check=True)
+            staged_install(["cmake", "--install", build_directory], build_directory, install_directory)
+        case "meson":
+            subprocess.run(["meson", "compile", "-C", build_directory], check=True)
+            staged_install(["meson", "install"], build_directory, install_directory)
+        case "make":
+            if lib == "ffmpeg":
+                # ffmpeg's makefiles don't know about the external libraries, remove what links them so it gets linked again
+                if STATIC_BUILD:
+                    # the programs link the external static libraries
+                    for name in LINKED_PROGRAMS:
+                        if os.path.exists(os.path.join(build_directory, name)):
+                            os.remove(os.path.join(build_directory, name))
+                else:
+                    for component in os.listdir(build_directory):
+                        component_directory = os.path.join(build_directory, component)
+
+                        if component.startswith("lib") and os.path.isdir(component_directory):
+                            for name in os.listdir(component_directory):
+                                if ".so" in name:
+                                    os.remove(os.path.join(component_directory, name))
+
+            subprocess.run(["make", f"-j{JOBS}"], cwd=build_directory, check=True)
+            staged_install(["make", "install"], build_directory, install_directory)
+        case "headers":
+            install_tree(os.path.join(CWD, "source", "amf", "amf", "public", "include"), os.path.join(INSTALL_ROOT, "all_architectures", "AMF"))
+
+
+def watch() -> None:
+    libs: list[str] = watched_libraries()
+    directories: list[str] = [os.path.join(CWD, "source", lib) for lib in libs]
+
+    print(f"Watching {", ".join(libs)} and the recipe files for changes")
+
+    for changed in changes(directories, RECIPE_FILES):
+        if any(path in RECIPE_FILES for path in changed):
+            print("Recipe changed, running the whole build again")
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+
+        affected: list[str] = [lib for lib, directory in zip(libs, directories) if any(path == directory or path.startswith(directory + os.sep) for path in changed)]
+
+        if not affected:
+            continue
+
+        start = time.monotonic()
+
+        try:
+            for lib in affected:
+                if lib == "ffmpeg":
+                    continue
+
+                if lib == "amf":
+                    rebuild(lib, ABIS[0])
+                    continue
+
+                for abi in ABIS:
+                    rebuild(lib, abi)
+
+            # link ffmpeg again so it picks up the rebuilt libraries
+            for abi in ABIS:
+                rebuild("ffmpeg", abi)
+        except subprocess.CalledProcessError as error:
+            print(f"Rebuild failed ({error}), waiting for the next change")
+            continue
+
+        if DEDUP_INSTALLS:
+            prune_objects()
+
+        print(f"Rebuilt {", ".join(affected)} for all enabled abis in {time.monotonic() - start:.1f}s")